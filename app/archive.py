@@ -0,0 +1,206 @@
+"""
+Archivo de mensajes viejos.
+
+Los mensajes con más de MESSAGE_ARCHIVE_AFTER_DAYS días se pasan, por lotes
+de matches, de la tabla messages a message_archive, en bloques de hasta
+CHUNK_SIZE mensajes por match (líneas JSON comprimidas con zlib). Así
+messages queda chica y sus índices entran en memoria.
+
+- Por match se archiva siempre un prefijo: todos los mensajes con
+  id <= matches.archived_through_id están en el archivo y el resto en
+  messages. El historial lee de messages y solo baja al archivo cuando la
+  página pasa de ese id (ver chat.history_page).
+- No se archivan mensajes sin leer por su destinatario ni los KEEP_RECENT
+  más nuevos de cada match: los contadores de no leídos, la vista previa de
+  /inbox y la primera página del historial siguen saliendo solo de messages.
+
+Se corre a mano o desde cron:
+
+    python -m app.archive [--older-than-days 90] [--batch-size 200]
+"""
+import argparse
+import json
+import os
+import sys
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+
+from . import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "90"))
+CHUNK_SIZE = 500
+# Mensajes más nuevos de cada chat que nunca se archivan (una página de historial)
+KEEP_RECENT = 50
+# Matches por transacción
+BATCH_SIZE = 200
+
+
+class ArchivedMessage(NamedTuple):
+    """Mensaje leído del archivo, con los mismos campos que usa el historial"""
+    id: int
+    match_id: int
+    sender_id: int
+    content: str
+    created_at: datetime
+
+
+def pack(messages: Iterable) -> bytes:
+    lines = "\n".join(
+        json.dumps([message.id, message.sender_id, message.content, message.created_at.isoformat()],
+                   ensure_ascii=False, separators=(",", ":"))
+        for message in messages
+    )
+    return zlib.compress(lines.encode(), 6)
+
+
+def unpack(chunk: models.MessageArchive) -> List[ArchivedMessage]:
+    return [
+        ArchivedMessage(message_id, chunk.match_id, sender_id, content, datetime.fromisoformat(created_at))
+        for message_id, sender_id, content, created_at in (
+            json.loads(line) for line in zlib.decompress(chunk.payload).decode().split("\n")
+        )
+    ]
+
+
+def read_before(db: Session, match_id: int, before_id: int, count: int) -> List[ArchivedMessage]:
+    """Hasta `count` mensajes archivados con id < before_id, en orden cronológico"""
+    found: List[ArchivedMessage] = []
+    chunks = (
+        db.query(models.MessageArchive)
+        .filter(models.MessageArchive.match_id == match_id, models.MessageArchive.first_message_id < before_id)
+        .order_by(models.MessageArchive.last_message_id.desc())
+        .yield_per(4)
+    )
+    for chunk in chunks:
+        found = [message for message in unpack(chunk) if message.id < before_id] + found
+        if len(found) >= count:
+            break
+    return found[-count:] if count else []
+
+
+def read_after(db: Session, match_id: int, after_id: int, count: int) -> List[ArchivedMessage]:
+    """Hasta `count` mensajes archivados con id > after_id, en orden cronológico"""
+    found: List[ArchivedMessage] = []
+    chunks = (
+        db.query(models.MessageArchive)
+        .filter(models.MessageArchive.match_id == match_id, models.MessageArchive.last_message_id > after_id)
+        .order_by(models.MessageArchive.last_message_id)
+        .yield_per(4)
+    )
+    for chunk in chunks:
+        found += [message for message in unpack(chunk) if message.id > after_id]
+        if len(found) >= count:
+            break
+    return found[:count]
+
+
+def archive_match(db: Session, match: models.Match, cutoff: datetime) -> int:
+    """Archiva el prefijo archivable de `match` (ya bloqueado). No hace commit"""
+    # Los KEEP_RECENT más nuevos quedan siempre en messages
+    newest_kept = (
+        db.query(models.Message.id).filter(models.Message.match_id == match.id)
+        .order_by(models.Message.id.desc()).offset(KEEP_RECENT - 1).limit(1).scalar()
+    )
+    if newest_kept is None:
+        return 0
+    # Prefijo archivable: viejo, leído por el destinatario y anterior a los que se conservan
+    limit_id = min(match.user1_last_read_id or 0, match.user2_last_read_id or 0, newest_kept - 1)
+    archived = 0
+    while match.archived_through_id < limit_id:
+        candidates = (
+            db.query(models.Message)
+            .filter(
+                models.Message.match_id == match.id,
+                models.Message.id > match.archived_through_id,
+                models.Message.id <= limit_id,
+            )
+            .order_by(models.Message.id)
+            .limit(CHUNK_SIZE)
+            .all()
+        )
+        chunk = []
+        for message in candidates:
+            if message.created_at is None or message.created_at >= cutoff:
+                break
+            chunk.append(message)
+        if not chunk:
+            break
+        db.add(models.MessageArchive(
+            match_id=match.id,
+            first_message_id=chunk[0].id,
+            last_message_id=chunk[-1].id,
+            message_count=len(chunk),
+            payload=pack(chunk),
+        ))
+        db.execute(delete(models.Message).where(
+            models.Message.match_id == match.id,
+            models.Message.id > match.archived_through_id,
+            models.Message.id <= chunk[-1].id,
+        ))
+        match.archived_through_id = chunk[-1].id
+        archived += len(chunk)
+        if len(chunk) < len(candidates) or len(chunk) < CHUNK_SIZE:
+            break
+    return archived
+
+
+def archive_batch(db: Session, cutoff: datetime, after_id: int = 0, batch_size: int = BATCH_SIZE) -> Optional[int]:
+    """
+    Archiva los mensajes viejos de hasta `batch_size` matches con id >
+    after_id, en una transacción. Devuelve el id del último match revisado
+    (para el próximo lote) o None si no quedan.
+    """
+    # Un match creado después del corte no puede tener mensajes viejos.
+    # En orden de id para que dos archivadores no se traben entre sí
+    matches = (
+        db.query(models.Match)
+        .filter(models.Match.id > after_id, models.Match.created_at < cutoff)
+        .order_by(models.Match.id)
+        .limit(batch_size)
+        .with_for_update()
+        .all()
+    )
+    if not matches:
+        return None
+    for match in matches:
+        archive_match(db, match, cutoff)
+    db.commit()
+    return matches[-1].id
+
+
+def archive_old_messages(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE) -> int:
+    """Archiva todo lo archivable; devuelve cuántos mensajes quedaron en el archivo"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    before = db.query(func.coalesce(func.sum(models.MessageArchive.message_count), 0)).scalar()
+    after_id = 0
+    while after_id is not None:
+        after_id = archive_batch(db, cutoff, after_id, batch_size)
+    return db.query(func.coalesce(func.sum(models.MessageArchive.message_count), 0)).scalar() - before
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.archive")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        archived = archive_old_messages(db, args.older_than_days, args.batch_size)
+        print(f"✅ {archived} mensajes archivados")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error archivando mensajes: {e}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
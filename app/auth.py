@@ -1,13 +1,19 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from . import models
 from . import database
 from . import schemas
+from . import profile_events
+from .passwords import Overloaded, password_pool
+from .principals import Principal, principal_cache
+from .profile_cards import bump_version
+from .sports import sync_user_sports
 
 router = APIRouter()
 
@@ -19,14 +25,20 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+# Password hashing: bcrypt corre en el pool de app/passwords.py
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.verify(plain_password, hashed_password)[0]
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_pool.hash(password)
+
+def auth_overloaded() -> HTTPException:
+    """429 cuando el pool de contraseñas no admite más trabajo"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Demasiadas solicitudes de autenticación, reintentá en unos segundos",
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -38,7 +50,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def _decode_token(token: str) -> dict:
+    """Payload del JWT; lanza HTTPException 401 si no es válido o no tiene sub"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token inválido",
@@ -47,26 +60,75 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+def _user_by_email(db: Session, email: str) -> models.User:
+    """Usuario del sub del token (por uq_users_email_lower); 401 si no existe"""
+    user = db.query(models.User).filter(func.lower(models.User.email) == email.lower()).first()
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
+def authenticate_token(token: str, db: Session) -> models.User:
+    """Fila del usuario del JWT; lanza HTTPException 401 si el token no es válido"""
+    payload = _decode_token(token)
+    return _user_by_email(db, payload["sub"])
+
+def authenticate_principal(token: str, db: Session) -> Principal:
+    """
+    Principal del JWT desde principal_cache; solo va a la base si no está.
+    Lanza HTTPException 401 si el token no es válido.
+    """
+    payload = _decode_token(token)
+    sub, exp = payload["sub"], payload.get("exp")
+    principal, generation = principal_cache.get(sub, exp)
+    if principal is None:
+        principal = Principal.from_user(_user_by_email(db, sub))
+        principal_cache.put(sub, exp, principal, generation)
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    """Fila completa del usuario, para los endpoints que la leen o la modifican"""
+    return authenticate_token(token, db)
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> Principal:
+    """Id, email, username y profile_version del usuario, casi siempre sin consultar la base"""
+    return authenticate_principal(token, db)
+
+# login y register son async: la base va al threadpool y bcrypt al pool de
+# procesos (app/passwords.py), así un login no ocupa un thread del threadpool
+# mientras espera el hash.
+def _user_for_login(db: Session, email: str) -> Optional[models.User]:
+    return db.query(models.User).filter(func.lower(models.User.email) == email.lower()).first()
+
+def _save_password(db: Session, user: models.User, hashed: str) -> None:
+    user.password = hashed
+    db.commit()
+
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(_user_for_login, db, form_data.username)
+    try:
+        valid, new_hash = await password_pool.verify_async(form_data.password, user.password) if user else (False, None)
+    except Overloaded:
+        raise auth_overloaded()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Cambió BCRYPT_ROUNDS: se guarda el hash con el costo nuevo
+        await run_in_threadpool(_save_password, db, user, new_hash)
     access_token = create_access_token(data={"sub": user.email})
     return {
         "access_token": access_token,
@@ -84,13 +146,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
         }
     }
 
-@router.post("/register")
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email ya registrado")
-
-    hashed_pw = pwd_context.hash(user.password)
+def _create_user(db: Session, user: schemas.UserCreate, hashed_pw: str) -> None:
     new_user = models.User(
         username=user.username,
         email=user.email,
@@ -101,19 +157,34 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
         video_url=user.video_url,
         age=user.age,
         location=user.location,
+        latitude=user.latitude,
+        longitude=user.longitude,
         instagram=user.instagram,
         whatsapp=user.whatsapp,
         phone=user.phone
     )
+    sync_user_sports(db, new_user)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    profile_events.profile_changed(new_user)
+
+@router.post("/register")
+async def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    if await run_in_threadpool(_user_for_login, db, user.email):
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+
+    try:
+        hashed_pw = await password_pool.hash_async(user.password)
+    except Overloaded:
+        raise auth_overloaded()
+    await run_in_threadpool(_create_user, db, user, hashed_pw)
     return {"message": "Usuario registrado correctamente"}
 
 @router.put("/profile/update")
 def update_profile(
     user_update: schemas.UserUpdate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(database.get_db)
 ):
     user = db.query(models.User).filter(models.User.id == current_user.id).first()
@@ -123,9 +194,13 @@ def update_profile(
     update_data = user_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(user, key, value)
+    if "deportes_preferidos" in update_data:
+        sync_user_sports(db, user)
+    bump_version(user)
 
     db.commit()
     db.refresh(user)
+    profile_events.profile_changed(user, update_data.keys())
 
     return {
         "message": "Perfil actualizado correctamente",
@@ -0,0 +1,252 @@
+"""
+Mensajes y bandeja de chats (/inbox).
+
+Cada match guarda un resumen que se actualiza en la misma transacción que el
+mensaje: último mensaje, última actividad y un contador de no leídos por
+participante. Así la bandeja no recorre mensajes: una página son dos lecturas
+por índice sobre matches (una por cada lado del par, con
+ix_matches_user1_activity e ix_matches_user2_activity) unidas al otro usuario
+y al último mensaje, más la carga de deportes.
+
+Las páginas van de la actividad más reciente a la más vieja, ordenadas por
+(last_activity_at, id), con el mismo cursor que match_list.
+"""
+import heapq
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session, aliased
+
+from . import archive
+from . import models
+from . import realtime
+from .match_list import decode_cursor, encode_cursor
+from .sports import with_sports
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Mensajes por página del historial
+DEFAULT_HISTORY_SIZE = 50
+MAX_HISTORY_SIZE = 200
+
+
+class InboxEntry(NamedTuple):
+    match: models.Match
+    other_user: models.User
+    last_message: Optional[models.Message]
+    unread: int
+
+
+class NotParticipant(Exception):
+    pass
+
+
+class MatchNotFound(Exception):
+    pass
+
+
+def unread_column(match: models.Match, user_id: int):
+    """Columna de no leídos de `user_id` en `match`"""
+    return models.Match.user1_unread if match.user1_id == user_id else models.Match.user2_unread
+
+
+def last_read_column(match: models.Match, user_id: int):
+    """Columna con la marca de lectura de `user_id` en `match`"""
+    return models.Match.user1_last_read_id if match.user1_id == user_id else models.Match.user2_last_read_id
+
+
+def is_read(match: models.Match, message) -> bool:
+    """Si el destinatario del mensaje ya lo leyó, según su marca de lectura"""
+    watermark = match.user2_last_read_id if message.sender_id == match.user1_id else match.user1_last_read_id
+    return message.id <= (watermark or 0)
+
+
+def record_message(db: Session, match: models.Match, sender_id: int, content: str) -> models.Message:
+    """
+    Guarda el mensaje y actualiza el resumen del match en un solo UPDATE.
+    No hace commit. Lanza NotParticipant si el emisor no es parte del match.
+    """
+    if sender_id not in (match.user1_id, match.user2_id):
+        raise NotParticipant(sender_id)
+    message = models.Message(
+        match_id=match.id, sender_id=sender_id, content=content, created_at=datetime.utcnow()
+    )
+    db.add(message)
+    db.flush()
+
+    recipient_id = match.user2_id if sender_id == match.user1_id else match.user1_id
+    unread = unread_column(match, recipient_id)
+    # Con mensajes simultáneos gana el de id mayor, sin importar el orden de los UPDATE
+    newer = or_(models.Match.last_message_id.is_(None), models.Match.last_message_id < message.id)
+    db.query(models.Match).filter(models.Match.id == match.id).update({
+        models.Match.last_message_id: case((newer, message.id), else_=models.Match.last_message_id),
+        models.Match.last_activity_at: case((newer, message.created_at), else_=models.Match.last_activity_at),
+        unread: unread + 1,
+    }, synchronize_session=False)
+    return message
+
+
+def send_message(db: Session, match_id: int, sender_id: int, content: str) -> Dict[str, Any]:
+    """
+    Guarda el mensaje, hace commit y lo publica a los conectados (/ws/chat).
+    Devuelve el mensaje serializado. Lanza MatchNotFound o NotParticipant.
+    """
+    match = db.query(models.Match).filter(models.Match.id == match_id).first()
+    if match is None:
+        raise MatchNotFound(match_id)
+    message = record_message(db, match, sender_id, content)
+    payload = realtime.message_payload(message)
+    db.commit()
+    # Recién confirmado: quien lo reciba ya lo puede leer de la base
+    realtime.publish_message(match_id, payload)
+    return payload
+
+
+class Participants(NamedTuple):
+    match: models.Match
+    user1: models.User
+    user2: models.User
+
+
+def participants(db: Session, match_id: int) -> Optional[Participants]:
+    """El match y sus dos usuarios en una consulta por clave primaria; None si no existe"""
+    user1, user2 = aliased(models.User), aliased(models.User)
+    row = (
+        db.query(models.Match, user1, user2)
+        .join(user1, user1.id == models.Match.user1_id)
+        .join(user2, user2.id == models.Match.user2_id)
+        .filter(models.Match.id == match_id)
+        .first()
+    )
+    return Participants(*row) if row else None
+
+
+def mark_read(db: Session, match_id: int, user_id: int, last_read_id: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Mueve la marca de lectura de `user_id` hasta `last_read_id` (o el último
+    mensaje) y recalcula sus no leídos con un conteo por rango de
+    ix_messages_match_id. La marca nunca retrocede. Hace commit, publica el
+    evento "read" y devuelve (marca, no leídos).
+    Lanza MatchNotFound o NotParticipant.
+    """
+    # Con la fila bloqueada un mensaje simultáneo no puede perder su incremento de no leídos
+    match = db.query(models.Match).filter(models.Match.id == match_id).with_for_update().first()
+    if match is None:
+        raise MatchNotFound(match_id)
+    if user_id not in (match.user1_id, match.user2_id):
+        raise NotParticipant(user_id)
+
+    current = (match.user1_last_read_id if match.user1_id == user_id else match.user2_last_read_id) or 0
+    newest = match.last_message_id or 0
+    watermark = max(current, min(newest, last_read_id if last_read_id is not None else newest))
+    unread = db.query(func.count(models.Message.id)).filter(
+        models.Message.match_id == match_id,
+        models.Message.id > watermark,
+        models.Message.sender_id != user_id,
+    ).scalar()
+    db.query(models.Match).filter(models.Match.id == match_id).update({
+        last_read_column(match, user_id): watermark,
+        unread_column(match, user_id): unread,
+    }, synchronize_session=False)
+    db.commit()
+    if watermark != current:
+        realtime.publish_read(match_id, user_id, watermark)
+    return watermark, unread
+
+
+def history_version(found: Optional[Participants]) -> Optional[tuple]:
+    """
+    Marca de versión del historial para el ETag: último mensaje, marcas de
+    lectura (is_read) y profile_version de los dos participantes (sus
+    tarjetas van en cada mensaje).
+    """
+    if found is None:
+        return None
+    match = found.match
+    return (
+        match.last_message_id, match.user1_last_read_id, match.user2_last_read_id,
+        found.user1.profile_version, found.user2.profile_version,
+    )
+
+
+def history_page(
+    db: Session,
+    match_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = DEFAULT_HISTORY_SIZE,
+    archived_through: int = 0,
+) -> Tuple[List[Any], bool]:
+    """
+    Una página del historial, siempre en orden cronológico, y si hay más:
+    - sin cursores: los `limit` mensajes más nuevos (has_more: hay anteriores)
+    - before_id: los `limit` anteriores a ese id (has_more: hay anteriores)
+    - after_id: los `limit` posteriores a ese id (has_more: hay posteriores)
+    Recorre ix_messages_match_id por rango: no depende del largo del chat.
+    Los mensajes con id <= `archived_through` (Match.archived_through_id) se
+    leen de message_archive solo si la página llega hasta ahí.
+    """
+    query = db.query(models.Message).filter(models.Message.match_id == match_id)
+    if after_id is not None:
+        rows: List[Any] = []
+        if after_id < archived_through:
+            rows = archive.read_after(db, match_id, after_id, limit + 1)
+            after_id = archived_through
+        if len(rows) <= limit:
+            rows += query.filter(models.Message.id > after_id).order_by(models.Message.id).limit(limit + 1 - len(rows)).all()
+        return rows[:limit], len(rows) > limit
+    if before_id is not None:
+        query = query.filter(models.Message.id < before_id)
+    rows = query.order_by(models.Message.id.desc()).limit(limit + 1).all()[::-1]
+    if len(rows) == limit and archived_through:
+        # Página completa y el archivo debajo: hay más sin leerlo
+        return rows, True
+    if len(rows) < limit and archived_through:
+        bound = min(rows[0].id if rows else archived_through + 1, before_id or archived_through + 1)
+        rows = archive.read_before(db, match_id, bound, limit + 1 - len(rows)) + rows
+    return rows[-limit:], len(rows) > limit
+
+
+def inbox_page(
+    db: Session, user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+) -> Tuple[List[InboxEntry], Optional[str]]:
+    """Devuelve ([InboxEntry], next_cursor), de la actividad más reciente a la más vieja"""
+    after = decode_cursor(cursor) if cursor else None
+    rows = heapq.merge(
+        _side(db, user_id, models.Match.user1_id, models.Match.user2_id, after, limit + 1),
+        _side(db, user_id, models.Match.user2_id, models.Match.user1_id, after, limit + 1),
+        key=lambda row: (row[0].last_activity_at, row[0].id),
+        reverse=True,
+    )
+    entries = []
+    for match, other_user, last_message in rows:
+        unread = match.user1_unread if match.user1_id == user_id else match.user2_unread
+        entries.append(InboxEntry(match, other_user, last_message, unread))
+        if len(entries) > limit:
+            break
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        last = entries[-1].match
+        next_cursor = encode_cursor(last.last_activity_at, last.id)
+    return entries, next_cursor
+
+
+def _side(db: Session, user_id: int, own_column, other_column, after, limit: int):
+    """Matches donde `user_id` está en `own_column`, ya ordenados"""
+    query = (
+        with_sports(db.query(models.Match, models.User, models.Message))
+        .join(models.User, models.User.id == other_column)
+        .outerjoin(models.Message, models.Message.id == models.Match.last_message_id)
+        .filter(own_column == user_id)
+    )
+    if after is not None:
+        last_activity_at, match_id = after
+        query = query.filter(or_(
+            models.Match.last_activity_at < last_activity_at,
+            and_(models.Match.last_activity_at == last_activity_at, models.Match.id < match_id),
+        ))
+    return query.order_by(models.Match.last_activity_at.desc(), models.Match.id.desc()).limit(limit).all()
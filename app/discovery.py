@@ -0,0 +1,200 @@
+"""
+Búsqueda paginada de usuarios compatibles para /users/compatible.
+
+Las páginas se ordenan por (score desc, id asc) y se recorren con un cursor
+opaco que codifica el último (score, id) devuelto, así cada request trae a lo
+sumo `limit` usuarios de la base sin importar cuántos haya.
+
+Si el índice en memoria (sport_index) está listo se usa para elegir los ids
+de la página; si no (por ejemplo con varios workers y el índice deshabilitado)
+los filtros se resuelven directamente en SQL.
+
+El filtro por distancia funciona como el de ubicación: los usuarios sin
+coordenadas no se descartan. En memoria se resuelve con geo.geo_index; en SQL
+con un prefiltro por caja (lat/lon entre límites) y la distancia exacta se
+verifica en Python sobre las filas que pasan.
+"""
+import base64
+import heapq
+import json
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, exists, literal, or_, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .geo import bounding_box, geo_index, haversine_km
+from .seen import SeenSet
+from .sports import with_sports
+from .sport_index import DEFAULT_AGE, profile_index
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+BASE_SCORE = 60
+SCORE_PER_SPORT = 10
+MAX_SCORE = 95
+
+
+def encode_cursor(score: int, user_id: int) -> str:
+    raw = json.dumps([score, user_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Decodifica un cursor de encode_cursor; lanza ValueError si es inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(score), int(user_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def score_for(matched_sports: int) -> int:
+    """Score base 60, +10 por deporte en común, máximo 95"""
+    return min(BASE_SCORE + SCORE_PER_SPORT * matched_sports, MAX_SCORE)
+
+
+def search_page(
+    db: Session,
+    current_user_id: int,
+    min_age: int,
+    max_age: int,
+    location: Optional[str] = None,
+    sport_names: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    seen: Optional[SeenSet] = None,
+    origin: Optional[Tuple[float, float]] = None,
+    max_distance_km: Optional[float] = None,
+) -> Tuple[List[Tuple[int, models.User]], Optional[str]]:
+    """
+    Devuelve ([(score, usuario)], next_cursor) para una página de resultados.
+    Con el índice en memoria los usuarios de `seen` se descartan antes de
+    rankear; en SQL se excluyen los likes y dislikes del usuario.
+    Si vienen `origin` (lat, lon) y `max_distance_km` solo se devuelven
+    usuarios dentro de ese radio (o sin coordenadas).
+    """
+    after = decode_cursor(cursor) if cursor else None
+    radius = (origin, max_distance_km) if origin is not None and max_distance_km else None
+    if profile_index.ready and (radius is None or geo_index.ready):
+        rows = _page_from_index(db, current_user_id, min_age, max_age, location, sport_names, after, limit, seen, radius)
+    else:
+        rows = _page_from_sql(db, current_user_id, min_age, max_age, location, sport_names, after, limit, radius)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        score, user = rows[-1]
+        next_cursor = encode_cursor(score, user.id)
+    return rows, next_cursor
+
+
+def _page_from_index(db, current_user_id, min_age, max_age, location, sport_names, after, limit, seen, radius):
+    candidates: Dict[int, int] = profile_index.search(
+        min_age, max_age, location=location, sports=sport_names, exclude=current_user_id
+    )
+    nearby = geo_index.within(*radius[0], radius[1]) if radius is not None else None
+    ranked = (
+        (score_for(count), user_id)
+        for user_id, count in candidates.items()
+        if (seen is None or user_id not in seen)
+        and (nearby is None or user_id in nearby or user_id not in geo_index)
+    )
+    if after is not None:
+        after_key = (-after[0], after[1])
+        ranked = (item for item in ranked if (-item[0], item[1]) > after_key)
+    page = heapq.nsmallest(limit + 1, ranked, key=lambda item: (-item[0], item[1]))
+    if not page:
+        return []
+
+    users = {
+        user.id: user
+        for user in with_sports(db.query(models.User)).filter(models.User.id.in_([user_id for _, user_id in page]))
+    }
+    # Un usuario puede haberse borrado desde otro worker; se omite
+    return [(score, users[user_id]) for score, user_id in page if user_id in users]
+
+
+def _page_from_sql(db, current_user_id, min_age, max_age, location, sport_names, after, limit, radius):
+    User = models.User
+    filters = [
+        User.id != current_user_id,
+        ~exists().where(models.Like.user_id == current_user_id, models.Like.liked_user_id == User.id),
+        ~exists().where(models.Dislike.user_id == current_user_id, models.Dislike.disliked_user_id == User.id),
+    ]
+
+    # Edad: los usuarios sin edad cuentan como DEFAULT_AGE
+    age_filter = User.age.between(min_age, max_age)
+    if min_age <= DEFAULT_AGE <= max_age:
+        age_filter = or_(age_filter, User.age.is_(None), User.age == 0)
+    filters.append(age_filter)
+
+    # Ubicación: misma ubicación sin distinguir mayúsculas, o ubicación vacía
+    if location:
+        filters.append(or_(
+            func.lower(User.location) == location.lower(),
+            User.location.is_(None),
+            User.location == "",
+        ))
+
+    score = literal(BASE_SCORE)
+    if sport_names:
+        # Deportes filtrados que practica cada usuario, vía el índice de user_sports
+        sport_ids = [
+            row[0] for row in db.query(models.Sport.id).filter(models.Sport.normalized.in_(set(sport_names)))
+        ]
+        if not sport_ids:
+            return []
+        filters.append(exists().where(
+            models.UserSport.user_id == User.id, models.UserSport.sport_id.in_(sport_ids)
+        ))
+        matched = (
+            select(func.count())
+            .select_from(models.UserSport)
+            .where(models.UserSport.user_id == User.id, models.UserSport.sport_id.in_(sport_ids))
+            .scalar_subquery()
+        )
+        score = case(
+            (matched * SCORE_PER_SPORT >= MAX_SCORE - BASE_SCORE, MAX_SCORE),
+            else_=BASE_SCORE + SCORE_PER_SPORT * matched,
+        )
+    score = score.label("score")
+
+    if radius is not None:
+        (lat, lon), km = radius
+        lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon, km)
+        filters.append(or_(
+            User.latitude.is_(None),
+            User.longitude.is_(None),
+            and_(User.latitude.between(lat_min, lat_max), User.longitude.between(lon_min, lon_max)),
+        ))
+
+    def fetch(after, count):
+        keyset = []
+        if after is not None:
+            keyset.append(or_(score < after[0], and_(score == after[0], User.id > after[1])))
+        return (
+            with_sports(db.query(User, score))
+            .filter(*filters, *keyset)
+            .order_by(score.desc(), User.id)
+            .limit(count)
+            .all()
+        )
+
+    if radius is None:
+        return [(int(row_score), user) for user, row_score in fetch(after, limit + 1)]
+
+    # Las esquinas de la caja quedan fuera del radio: se descartan acá y se
+    # sigue leyendo hasta completar la página
+    page = []
+    while len(page) <= limit:
+        rows = fetch(after, limit + 1)
+        for user, row_score in rows:
+            if user.latitude is None or user.longitude is None or haversine_km(lat, lon, user.latitude, user.longitude) <= km:
+                page.append((int(row_score), user))
+        if len(rows) <= limit:
+            break
+        after = (int(rows[-1][1]), rows[-1][0].id)
+    return page[:limit + 1]
@@ -0,0 +1,157 @@
+"""
+Filtro de Bloom sobre los likes (user_id -> liked_user_id).
+
+La mayoría de los likes no son correspondidos. Si el filtro dice que el like
+inverso no existe, es seguro: no hay que consultar likes ni matches. Si dice
+que puede existir se consulta la base como siempre (falsos positivos ~1% con
+la capacidad configurada).
+
+- Se arma al iniciar con todos los likes de la base.
+- Los likes se agregan al filtro ANTES de insertarlos, así un like mutuo
+  simultáneo en otro thread no puede ver un "no existe" equivocado.
+- Un filtro de Bloom no admite borrar: los likes que se deshacen con un
+  dislike quedan como falsos positivos (se cuentan en `stale`) hasta el
+  próximo reinicio.
+
+Con varios workers cada proceso solo ve sus propios likes y el filtro podría
+negar un like hecho en otro proceso: en ese caso desactivarlo con
+EDGE_FILTER_ENABLED=0.
+"""
+import math
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+import numpy as np
+
+# Edges para los que se dimensiona el filtro y tasa de falsos positivos buscada
+CAPACITY = 10_000_000
+TARGET_FP_RATE = 0.01
+
+_MASK = (1 << 64) - 1
+_SEED2 = 0x5851F42D4C957F2D
+
+
+def _mix(x: int) -> int:
+    """splitmix64 sobre enteros de Python (misma cuenta que _mix_array)"""
+    z = (x + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+def _mix_array(x: np.ndarray) -> np.ndarray:
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _edge_key(user_id: int, liked_user_id: int) -> int:
+    return ((user_id & 0xFFFFFFFF) << 32) | (liked_user_id & 0xFFFFFFFF)
+
+
+class EdgeFilter:
+    def __init__(self, capacity: int = CAPACITY, fp_rate: float = TARGET_FP_RATE):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        # Tamaño óptimo: m = -n ln p / (ln 2)^2 bits y k = m/n ln 2 hashes
+        self.num_bits = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        # Se reserva al construir: deshabilitado no ocupa memoria
+        self._bits = bytearray()
+        self._lock = threading.Lock()
+        self.edges = 0
+        self.stale = 0
+        self.checks = 0
+        self.definitely_absent = 0
+        self.false_positives = 0
+        self.ready = False
+
+    def build(self, edges: Iterable[Tuple[int, int]], batch_size: int = 100_000) -> None:
+        """Arma el filtro desde cero con un iterable de (user_id, liked_user_id)"""
+        bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        count = 0
+        batch = []
+        for edge in edges:
+            batch.append(edge)
+            if len(batch) == batch_size:
+                count += self._add_array(bits, batch)
+                batch = []
+        if batch:
+            count += self._add_array(bits, batch)
+        with self._lock:
+            self._bits = bytearray(bits.tobytes())
+            self.edges = count
+            self.stale = 0
+            self.ready = True
+
+    def add(self, user_id: int, liked_user_id: int) -> None:
+        if not self.ready:
+            return
+        positions = self._positions(_edge_key(user_id, liked_user_id))
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.edges += 1
+
+    def discard(self, user_id: int, liked_user_id: int) -> None:
+        """Un like deshecho no se puede sacar: solo se cuenta"""
+        if self.ready:
+            self.stale += 1
+
+    def might_contain(self, user_id: int, liked_user_id: int) -> bool:
+        """False solo si el like seguro no existe; sin construir siempre True"""
+        if not self.ready:
+            return True
+        self.checks += 1
+        bits = self._bits
+        for position in self._positions(_edge_key(user_id, liked_user_id)):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                self.definitely_absent += 1
+                return False
+        return True
+
+    def record_false_positive(self) -> None:
+        """El filtro dijo "puede existir" y la base dijo que no"""
+        self.false_positives += 1
+
+    def expected_fp_rate(self, edges: int) -> float:
+        """Tasa teórica de falsos positivos con `edges` elementos"""
+        return (1 - math.exp(-self.num_hashes * edges / self.num_bits)) ** self.num_hashes
+
+    def stats(self) -> Dict[str, Any]:
+        maybe = self.checks - self.definitely_absent
+        return {
+            "enabled": self.ready,
+            "edges": self.edges,
+            "stale_edges": self.stale,
+            "capacity": self.capacity,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "memory_bytes": len(self._bits),
+            "memory_bytes_at_capacity": (self.num_bits + 7) // 8,
+            "expected_fp_rate": round(self.expected_fp_rate(self.edges), 6),
+            "expected_fp_rate_at_capacity": round(self.expected_fp_rate(self.capacity), 6),
+            "checks": self.checks,
+            "skipped_lookups": self.definitely_absent,
+            "false_positives": self.false_positives,
+            "observed_fp_rate": round(self.false_positives / maybe, 6) if maybe else None,
+        }
+
+    def _positions(self, key: int):
+        h1 = _mix(key)
+        h2 = _mix(key ^ _SEED2) | 1
+        return [((h1 + i * h2) & _MASK) % self.num_bits for i in range(self.num_hashes)]
+
+    def _add_array(self, bits: np.ndarray, edges) -> int:
+        pairs = np.asarray(edges, dtype=np.uint64).reshape(-1, 2)
+        keys = ((pairs[:, 0] & np.uint64(0xFFFFFFFF)) << np.uint64(32)) | (pairs[:, 1] & np.uint64(0xFFFFFFFF))
+        h1 = _mix_array(keys)
+        h2 = _mix_array(keys ^ np.uint64(_SEED2)) | np.uint64(1)
+        for i in range(self.num_hashes):
+            positions = (h1 + np.uint64(i) * h2) % np.uint64(self.num_bits)
+            np.bitwise_or.at(bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        return len(pairs)
+
+
+edge_filter = EdgeFilter()
@@ -0,0 +1,89 @@
+"""
+GET condicionales (ETag / If-None-Match).
+
+Cada endpoint arma el ETag con marcas de versión baratas (profile_version,
+cantidad e id máximo de matches, último mensaje del match) y lo compara con
+If-None-Match antes de la consulta pesada y la serialización. Si coincide se
+responde 304 sin cuerpo.
+
+Las marcas vienen de la base y no de memoria, así que funciona igual con
+varios workers.
+"""
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# El cliente puede guardar la respuesta pero tiene que revalidarla siempre
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag fuerte a partir de las marcas de versión (y los parámetros del request)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match, como pide RFC 7232"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ETagStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ruta -> [consultas con ETag calculado, respuestas 304]
+        self._routes: Dict[str, list] = {}
+
+    def record(self, route: str, hit: bool) -> None:
+        with self._lock:
+            counts = self._routes.setdefault(route, [0, 0])
+            counts[0] += 1
+            counts[1] += hit
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checks = sum(counts[0] for counts in self._routes.values())
+            hits = sum(counts[1] for counts in self._routes.values())
+            return {
+                "checks": checks,
+                "not_modified": hits,
+                "hit_rate": round(hits / checks, 4) if checks else None,
+                "routes": {
+                    route: {
+                        "checks": counts[0],
+                        "not_modified": counts[1],
+                        "hit_rate": round(counts[1] / counts[0], 4) if counts[0] else None,
+                    }
+                    for route, counts in self._routes.items()
+                },
+            }
+
+
+etag_stats = ETagStats()
+
+
+def conditional(request: Request, route: str, etag: str, build: Callable[[], Any]) -> Response:
+    """
+    304 si el cliente ya tiene `etag`; si no, arma el cuerpo con `build()` y
+    lo devuelve con el ETag.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    hit = matches(request.headers.get("if-none-match"), etag)
+    etag_stats.record(route, hit)
+    if hit:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(build()), headers=headers)
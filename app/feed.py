@@ -0,0 +1,196 @@
+"""
+Feed de descubrimiento precalculado por usuario.
+
+Para cada usuario activo se guarda una cola ordenada de candidatos
+(score, id, deportes en común) que arma un worker en segundo plano con
+matching.get_compatible_users. Leer una página del feed cuesta O(página) y
+los swipes sacan al candidato de la cola.
+
+Cuando un perfil cambia deportes, edad, ubicación o coordenadas:
+- si el usuario tiene feed, se vuelve a armar en segundo plano
+- en los feeds donde aparece como candidato se recalcula solo su score
+"""
+import bisect
+import queue
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from . import database
+from . import models
+from .matching import calculate_compatibility_score, get_common_sports, get_compatible_users
+from .seen import seen_store
+from .sports import with_sports
+
+FEED_SIZE = 200
+MAX_FEEDS = 10000
+# Cuando quedan menos candidatos que esto se pide rearmar el feed
+REFILL_THRESHOLD = FEED_SIZE // 4
+
+# Campos del perfil que afectan el score de compatibilidad
+SCORED_FIELDS = {"deportes_preferidos", "age", "location", "latitude", "longitude"}
+
+
+class FeedEntry(NamedTuple):
+    score: float
+    user_id: int
+    common_sports: List[str]
+
+    @property
+    def sort_key(self):
+        return (-self.score, self.user_id)
+
+
+class _Profile(NamedTuple):
+    """Copia mínima del perfil del dueño del feed para recalcular scores"""
+    id: int
+    sport_levels: tuple
+    age: Optional[int]
+    location: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class _Feed:
+    def __init__(self, owner: _Profile, entries: List[FeedEntry]):
+        self.owner = owner
+        self.entries = entries
+        self.keys = [entry.sort_key for entry in entries]
+
+    def remove(self, user_id: int) -> bool:
+        for i, entry in enumerate(self.entries):
+            if entry.user_id == user_id:
+                del self.entries[i]
+                del self.keys[i]
+                return True
+        return False
+
+    def insert(self, entry: FeedEntry) -> None:
+        i = bisect.bisect_left(self.keys, entry.sort_key)
+        self.entries.insert(i, entry)
+        self.keys.insert(i, entry.sort_key)
+
+
+class FeedStore:
+    def __init__(self, size: int = FEED_SIZE, max_feeds: int = MAX_FEEDS):
+        self.size = size
+        self.max_feeds = max_feeds
+        self._lock = threading.RLock()
+        self._feeds: "OrderedDict[int, _Feed]" = OrderedDict()
+        # candidato -> dueños de los feeds donde aparece
+        self._members: Dict[int, Set[int]] = {}
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._pending: Set[int] = set()
+        self._worker: Optional[threading.Thread] = None
+
+    def page(self, db, owner: models.User, limit: int) -> List[FeedEntry]:
+        """Primeros `limit` candidatos del feed; si no existe se arma en el momento"""
+        with self._lock:
+            feed = self._feeds.get(owner.id)
+            if feed is not None:
+                self._feeds.move_to_end(owner.id)
+        if feed is None:
+            feed = self._build(db, owner)
+        with self._lock:
+            entries = feed.entries[:limit]
+            remaining = len(feed.entries)
+        if remaining < REFILL_THRESHOLD:
+            self.request_build(owner.id)
+        return entries
+
+    def pop(self, owner_id: int, user_id: int) -> None:
+        """Saca a `user_id` del feed de `owner_id` (like o dislike)"""
+        with self._lock:
+            feed = self._feeds.get(owner_id)
+            if feed is not None and feed.remove(user_id):
+                self._unlink(user_id, owner_id)
+
+    def profile_changed(self, user, fields=None) -> None:
+        if fields is not None and not SCORED_FIELDS.intersection(fields):
+            return
+        with self._lock:
+            if user.id in self._feeds:
+                self.request_build(user.id)
+            owners = list(self._members.get(user.id, ()))
+            for owner_id in owners:
+                feed = self._feeds[owner_id]
+                feed.remove(user.id)
+                entry = FeedEntry(
+                    calculate_compatibility_score(feed.owner, user),
+                    user.id,
+                    get_common_sports(feed.owner, user),
+                )
+                if len(feed.entries) < self.size or entry.sort_key < feed.keys[-1]:
+                    feed.insert(entry)
+                else:
+                    self._unlink(user.id, owner_id)
+
+    def profile_removed(self, user_id: int) -> None:
+        with self._lock:
+            self._drop(user_id)
+            for owner_id in list(self._members.get(user_id, ())):
+                self.pop(owner_id, user_id)
+
+    def request_build(self, owner_id: int) -> None:
+        with self._lock:
+            if owner_id in self._pending:
+                return
+            self._pending.add(owner_id)
+        self._queue.put(owner_id)
+
+    def start_worker(self) -> None:
+        if self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._run, name="feed-builder", daemon=True)
+        self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            owner_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(owner_id)
+            db = database.SessionLocal()
+            try:
+                owner = with_sports(db.query(models.User)).filter(models.User.id == owner_id).first()
+                if owner is None:
+                    self.profile_removed(owner_id)
+                else:
+                    self._build(db, owner)
+            except Exception as e:
+                print(f"❌ Error armando feed del usuario {owner_id}: {e}")
+            finally:
+                db.close()
+
+    def _build(self, db, owner: models.User) -> _Feed:
+        # Los usuarios ya vistos se descartan antes de rankear
+        seen = seen_store.get(db, owner.id)
+        entries = [
+            FeedEntry(item["compatibility_score"], item["user"].id, item["common_sports"])
+            for item in get_compatible_users(db, owner, self.size, seen)
+        ]
+        feed = _Feed(_Profile(owner.id, owner.sport_levels, owner.age, owner.location, owner.latitude, owner.longitude), entries)
+
+        with self._lock:
+            self._drop(owner.id)
+            self._feeds[owner.id] = feed
+            for entry in entries:
+                self._members.setdefault(entry.user_id, set()).add(owner.id)
+            while len(self._feeds) > self.max_feeds:
+                self._drop(next(iter(self._feeds)))
+        return feed
+
+    def _drop(self, owner_id: int) -> None:
+        feed = self._feeds.pop(owner_id, None)
+        if feed is not None:
+            for entry in feed.entries:
+                self._unlink(entry.user_id, owner_id)
+
+    def _unlink(self, user_id: int, owner_id: int) -> None:
+        owners = self._members.get(user_id)
+        if owners is not None:
+            owners.discard(owner_id)
+            if not owners:
+                del self._members[user_id]
+
+
+feed_store = FeedStore()
@@ -0,0 +1,140 @@
+"""
+Búsqueda por radio sobre la latitud/longitud de los usuarios.
+
+GridIndex reparte a los usuarios en celdas de CELL_DEGREES grados. Buscar
+"usuarios a menos de N km" recorre solo las celdas que tocan la caja que
+rodea al círculo y calcula la distancia exacta (haversine) sobre esos pocos
+candidatos. bounding_box sirve también como prefiltro en SQL.
+"""
+import math
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# ~11 km de alto por celda
+CELL_DEGREES = 0.1
+
+# Puntos de cercanía del score de compatibilidad: (hasta km, puntos)
+PROXIMITY_POINTS = ((5, 10), (20, 6), (50, 3))
+
+
+def has_coordinates(user) -> bool:
+    return user.latitude is not None and user.longitude is not None
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def proximity_points(distance_km: float) -> int:
+    for max_km, points in PROXIMITY_POINTS:
+        if distance_km <= max_km:
+            return points
+    return 0
+
+
+def bounding_box(lat: float, lon: float, km: float) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) que contiene el círculo de radio `km`"""
+    dlat = km / KM_PER_DEGREE
+    lat_min, lat_max = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    # Cerca de los polos la caja cubre todas las longitudes
+    max_abs_lat = max(abs(lat_min), abs(lat_max))
+    if max_abs_lat >= 89.9:
+        return lat_min, lat_max, -180.0, 180.0
+    dlon = km / (KM_PER_DEGREE * math.cos(math.radians(max_abs_lat)))
+    return lat_min, lat_max, max(-180.0, lon - dlon), min(180.0, lon + dlon)
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lon / CELL_DEGREES))
+
+
+class GridIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self.ready = False
+
+    def build(self, users) -> None:
+        cells: Dict[Tuple[int, int], Set[int]] = {}
+        points = {}
+        for user in users:
+            if has_coordinates(user):
+                points[user.id] = (user.latitude, user.longitude)
+                cells.setdefault(_cell(user.latitude, user.longitude), set()).add(user.id)
+        with self._lock:
+            self._cells = cells
+            self._points = points
+            self.ready = True
+
+    def upsert(self, user) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._remove_locked(user.id)
+            if has_coordinates(user):
+                self._points[user.id] = (user.latitude, user.longitude)
+                self._cells.setdefault(_cell(user.latitude, user.longitude), set()).add(user.id)
+
+    def remove(self, user_id: int) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._points
+
+    def within(self, lat: float, lon: float, km: float) -> Dict[int, float]:
+        """{user_id: distancia en km} de los usuarios a menos de `km`"""
+        lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon, km)
+        row_min, col_min = _cell(lat_min, lon_min)
+        row_max, col_max = _cell(lat_max, lon_max)
+        result = {}
+        with self._lock:
+            if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+                # Radio enorme: es más barato recorrer las celdas ocupadas
+                cells = [
+                    ids for (row, col), ids in self._cells.items()
+                    if row_min <= row <= row_max and col_min <= col <= col_max
+                ]
+            else:
+                cells = [
+                    self._cells[(row, col)]
+                    for row in range(row_min, row_max + 1)
+                    for col in range(col_min, col_max + 1)
+                    if (row, col) in self._cells
+                ]
+            for ids in cells:
+                for user_id in ids:
+                    distance = haversine_km(lat, lon, *self._points[user_id])
+                    if distance <= km:
+                        result[user_id] = distance
+        return result
+
+    def _remove_locked(self, user_id: int) -> None:
+        point = self._points.pop(user_id, None)
+        if point is not None:
+            cell = _cell(*point)
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._cells[cell]
+
+
+geo_index = GridIndex()
+
+
+def distance_between(user1, user2) -> Optional[float]:
+    if not (has_coordinates(user1) and has_coordinates(user2)):
+        return None
+    return haversine_km(user1.latitude, user1.longitude, user2.latitude, user2.longitude)
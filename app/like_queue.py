@@ -0,0 +1,237 @@
+"""
+Modo write-behind para los likes (LIKE_QUEUE_ENABLED=1).
+
+Un like se confirma al cliente apenas queda escrito (y con fsync) en un
+journal local de solo-append. Un worker en segundo plano lo pasa a la tabla
+likes con inserts de varias filas cada FLUSH_INTERVAL segundos.
+
+- El match se detecta en el momento contra los likes pendientes en memoria,
+  edge_filter y, solo si el filtro no lo descarta, la base; is_match sigue
+  siendo correcto. El match (poco frecuente) se escribe directo en la base.
+- Los pendientes salen de memoria recién después del commit del flush, así
+  un like inverso siempre está o en memoria o en la base.
+- Después de cada flush se guarda en <journal>.checkpoint la última secuencia
+  escrita en la base. Al iniciar se vuelven a cargar las líneas posteriores
+  y se escriben antes de atender requests. Reinsertar es seguro por el
+  índice único de likes.
+- Dislikes y swipes en lote hacen flush antes de leer la tabla likes.
+
+Como edge_filter, solo sirve con un worker: otro proceso no ve los pendientes.
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from . import database
+from . import models
+from . import swipes
+from .edge_filter import edge_filter
+
+FLUSH_INTERVAL = 0.5
+FLUSH_BATCH_SIZE = 1000
+# Con todo escrito en la base, el journal se vacía al pasar este tamaño
+MAX_JOURNAL_BYTES = 64 * 1024 * 1024
+
+
+class LikeQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        # (user_id, liked_user_id) -> (seq, created_at), en orden de llegada
+        self._pending: Dict[Tuple[int, int], Tuple[int, datetime]] = {}
+        self._fd: Optional[int] = None
+        self._path: Optional[str] = None
+        self._fsync = True
+        self._seq = 0
+        self._written = 0
+        self._synced = 0
+        self._worker: Optional[threading.Thread] = None
+        self.enabled = False
+        self.appended = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.replayed = 0
+
+    def start(self, path: str, fsync: bool = True) -> None:
+        """Abre el journal, reprocesa lo que no llegó a la base y arranca el worker"""
+        self._path = path
+        self._fsync = fsync
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        checkpoint = self._read_checkpoint()
+        self._seq = checkpoint
+        self._replay(checkpoint)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.enabled = True
+        if self._pending:
+            print(f"🔁 Reprocesando {len(self._pending)} likes pendientes del journal")
+            while self.flush():
+                pass
+        self._worker = threading.Thread(target=self._run, name="like-queue", daemon=True)
+        self._worker.start()
+
+    def record_like(self, db, user_id: int, liked_user_id: int) -> swipes.LikeResult:
+        """
+        Mismo resultado que swipes.record_like, pero el like queda en el
+        journal en vez de insertarse. Hace commit solo si crea un match.
+        """
+        edge = (user_id, liked_user_id)
+        if db.query(models.User.id).filter(models.User.id == liked_user_id).first() is None:
+            raise swipes.TargetNotFound(liked_user_id)
+        if edge in self._pending or (
+            edge_filter.might_contain(user_id, liked_user_id) and swipes.has_liked(db, user_id, liked_user_id)
+        ):
+            match_id = swipes.find_match_id(db, user_id, liked_user_id)
+            return swipes.LikeResult(False, match_id is not None, match_id)
+
+        with self._lock:
+            # Revisar y agregar juntos: de dos likes mutuos simultáneos el segundo ve al primero
+            mutual = (liked_user_id, user_id) in self._pending
+            edge_filter.add(user_id, liked_user_id)
+            written = self._append(edge)
+        self._sync(written)
+
+        if not mutual and edge_filter.might_contain(liked_user_id, user_id):
+            mutual = swipes.has_liked(db, liked_user_id, user_id)
+            if not mutual:
+                edge_filter.record_false_positive()
+        if not mutual:
+            return swipes.LikeResult(True, False)
+
+        match_id = swipes.create_match(db, user_id, liked_user_id)
+        if match_id is None:
+            match_id = swipes.find_match_id(db, user_id, liked_user_id)
+        db.commit()
+        return swipes.LikeResult(True, True, match_id)
+
+    def flush(self) -> int:
+        """Escribe en la base hasta FLUSH_BATCH_SIZE likes pendientes; devuelve cuántos"""
+        if not self.enabled:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())[:FLUSH_BATCH_SIZE]
+            if not batch:
+                return 0
+            db = database.SessionLocal()
+            try:
+                swipes.insert_ignore(db, models.Like, swipes.LIKE_KEY, values=[
+                    {"user_id": user_id, "liked_user_id": liked_user_id, "created_at": created_at}
+                    for (user_id, liked_user_id), (_, created_at) in batch
+                ])
+                db.commit()
+            finally:
+                db.close()
+
+            with self._lock:
+                for edge, entry in batch:
+                    if self._pending.get(edge) is entry:
+                        del self._pending[edge]
+                # Todo lo anterior al primer pendiente ya está en la base
+                checkpoint = next(iter(self._pending.values()))[0] - 1 if self._pending else self._seq
+                compact = not self._pending and self._written > MAX_JOURNAL_BYTES
+                if compact:
+                    os.ftruncate(self._fd, 0)
+                    self._written = self._synced = 0
+            self._write_checkpoint(checkpoint)
+            self.flushed += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def drain(self) -> None:
+        """Escribe todos los pendientes (antes de leer la tabla likes)"""
+        while self.flush():
+            pass
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "appended": self.appended,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "replayed": self.replayed,
+            "journal_bytes": self._written,
+        }
+
+    def _append(self, edge: Tuple[int, int]) -> int:
+        """Con self._lock tomado. Devuelve hasta qué byte hay que sincronizar"""
+        self._seq += 1
+        created_at = datetime.utcnow()
+        line = f"{self._seq} {edge[0]} {edge[1]} {created_at.isoformat()}\n".encode()
+        os.write(self._fd, line)
+        self._written += len(line)
+        self._pending[edge] = (self._seq, created_at)
+        self.appended += 1
+        if len(self._pending) >= FLUSH_BATCH_SIZE:
+            self._wake.set()
+        return self._written
+
+    def _sync(self, written: int) -> None:
+        """fsync agrupado: un solo fsync cubre a todos los que esperaban"""
+        if not self._fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= written:
+                return
+            target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                while self.flush() == FLUSH_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                # Los likes siguen pendientes y en el journal: se reintenta
+                print(f"❌ Error escribiendo likes pendientes: {e}")
+
+    def _replay(self, checkpoint: int) -> None:
+        if not os.path.exists(self._path):
+            return
+        complete = 0
+        with open(self._path, "rb") as journal:
+            for raw in journal:
+                if not raw.endswith(b"\n"):
+                    # Última línea cortada por una caída a mitad de escritura
+                    break
+                complete += len(raw)
+                try:
+                    seq, user_id, liked_user_id, created_at = raw.decode().split()
+                    entry = (int(seq), datetime.fromisoformat(created_at))
+                    edge = (int(user_id), int(liked_user_id))
+                except ValueError:
+                    continue
+                self._seq = max(self._seq, entry[0])
+                if entry[0] > checkpoint:
+                    self._pending.setdefault(edge, entry)
+        if complete < os.path.getsize(self._path):
+            # Se descarta para que el próximo append no quede pegado a ella
+            os.truncate(self._path, complete)
+        self._written = self._synced = complete
+        self.replayed = len(self._pending)
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self._path + ".checkpoint") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, seq: int) -> None:
+        tmp = self._path + ".checkpoint.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(seq))
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self._path + ".checkpoint")
+
+
+like_queue = LikeQueue()
@@ -0,0 +1,133 @@
+"""
+Índice aproximado de similitud de deportes (MinHash + LSH).
+
+Cada usuario se resume en una firma MinHash de BANDS * ROWS valores sobre su
+conjunto de deportes (con nivel si include_level). La firma se corta en
+bandas y cada banda va a un bucket: dos usuarios son candidatos si coinciden
+en al menos una banda, lo que pasa con probabilidad 1 - (1 - J^ROWS)^BANDS
+para una similitud de Jaccard J.
+
+Así los candidatos de un usuario salen de BANDS lookups en vez de recorrer a
+toda la población. Es opcional (LSH_ENABLED=1); benchmarks/lsh_recall.py
+mide el recall contra el scorer exacto para elegir BANDS y ROWS.
+"""
+import hashlib
+import heapq
+import random
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+BANDS = 16
+ROWS = 2
+
+# Primo de Mersenne 2^61 - 1 para las permutaciones (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+_SEED = 20240101
+
+
+def _token_hash(token) -> int:
+    """Hash estable entre procesos (hash() de Python cambia con cada arranque)"""
+    raw = "\x1f".join(token).encode() if isinstance(token, tuple) else token.encode()
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "big") % _PRIME
+
+
+class SportLSH:
+    def __init__(self, bands: int = BANDS, rows: int = ROWS, include_level: bool = True):
+        self.bands = bands
+        self.rows = rows
+        self.include_level = include_level
+        rng = random.Random(_SEED)
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(bands * rows)
+        ]
+        self._lock = threading.RLock()
+        self._buckets: Dict[Tuple[int, tuple], Set[int]] = {}
+        self._tokens: Dict[int, frozenset] = {}
+        self._keys: Dict[int, List[Tuple[int, tuple]]] = {}
+        self.ready = False
+
+    def tokens(self, user) -> frozenset:
+        if self.include_level:
+            # Misma identidad que calculate_compatibility_score
+            return frozenset(sport.key for sport in user.sport_levels)
+        return frozenset(sport.name.lower() for sport in user.sport_levels)
+
+    def signature(self, tokens: Iterable) -> List[int]:
+        hashes = [_token_hash(token) for token in tokens]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def band_keys(self, tokens: frozenset) -> List[Tuple[int, tuple]]:
+        signature = self.signature(tokens)
+        return [
+            (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def build(self, users) -> None:
+        with self._lock:
+            self._buckets = {}
+            self._tokens = {}
+            self._keys = {}
+            for user in users:
+                self._upsert_locked(user)
+            self.ready = True
+
+    def upsert(self, user) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._upsert_locked(user)
+
+    def remove(self, user_id: int) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def candidates(self, user, limit: int, exclude=None) -> List[Tuple[int, float]]:
+        """
+        Hasta `limit` usuarios (id, similitud) con deportes parecidos a los de
+        `user`, ordenados por similitud desc e id asc. La similitud es la
+        misma proporción que usa calculate_compatibility_score:
+        en común / max(tamaños).
+        """
+        tokens = self.tokens(user)
+        if not tokens:
+            return []
+        keys = self.band_keys(tokens)
+        with self._lock:
+            found: Set[int] = set()
+            for key in keys:
+                found.update(self._buckets.get(key, ()))
+            found.discard(user.id)
+            scored = (
+                (len(tokens & self._tokens[user_id]) / max(len(tokens), len(self._tokens[user_id])), user_id)
+                for user_id in found
+                if exclude is None or user_id not in exclude
+            )
+            best = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+        return [(user_id, similarity) for similarity, user_id in best]
+
+    def _upsert_locked(self, user) -> None:
+        self._remove_locked(user.id)
+        tokens = self.tokens(user)
+        if not tokens:
+            # Sin deportes no hay similitud posible
+            return
+        keys = self.band_keys(tokens)
+        self._tokens[user.id] = tokens
+        self._keys[user.id] = keys
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(user.id)
+
+    def _remove_locked(self, user_id: int) -> None:
+        self._tokens.pop(user_id, None)
+        for key in self._keys.pop(user_id, ()):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+sport_lsh = SportLSH()
@@ -1,35 +1,51 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
 from . import models
 from . import schemas
 from . import auth
 from . import database
-from .database import Base, engine
+from . import discovery
+from . import profile_events
+from . import migrations
+from . import swipes
+from . import match_list
+from . import chat
+from . import realtime
+from .etag import conditional, etag_stats, make_etag
+from .database import engine
 from fastapi.staticfiles import StaticFiles
+import asyncio
+import json
 import os
 import uuid
 import shutil
 from dotenv import load_dotenv
 import bcrypt
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth import pwd_context
+from .passwords import password_pool, pwd_context
+from .sport_index import profile_index
+from .sports import parse_sport_names, sports_payload, sync_user_sports, backfill_user_sports, with_sports
+from .feed import feed_store
+from .scoring import profile_matrix
+from .seen import seen_store
+from .geo import geo_index, has_coordinates, distance_between
+from .lsh import sport_lsh
+from .profile_cards import profile_cards, bump_version
+from .principals import principal_cache
+from .edge_filter import edge_filter
+from .like_queue import like_queue
 
 # Cargar variables de entorno
 load_dotenv()
 
 app = FastAPI()
 
-# Crear las tablas en la base de datos - CON LOGGING
-print("🔄 Conectando a la base de datos...")
-try:
-    print("📋 Creando tablas en la base de datos...")
-    Base.metadata.create_all(bind=engine)
-    print("✅ Tablas creadas exitosamente!")
-except Exception as e:
-    print(f"❌ Error creando tablas: {e}")
-
 # Configuración de CORS
 app.add_middleware(
     CORSMiddleware,
@@ -50,6 +66,104 @@ def get_db():
 # Rutas de autenticación
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 
+# Migraciones de esquema (ver app/migrations.py) y migración de
+# deportes_preferidos a user_sports. Con MIGRATIONS_AUTO_APPLY=0 solo se avisa
+# de las pendientes y se aplican con `python -m app.migrations upgrade`.
+@app.on_event("startup")
+def prepare_database():
+    try:
+        if os.getenv("MIGRATIONS_AUTO_APPLY", "1") == "1":
+            applied = migrations.upgrade(engine)
+            print(f"✅ Esquema al día ({len(applied)} migraciones aplicadas)")
+        else:
+            missing = migrations.pending(engine)
+            if missing:
+                print(f"⚠️ Migraciones pendientes: {', '.join(str(m.version) for m in missing)}")
+    except Exception as e:
+        print(f"❌ Error aplicando migraciones: {e}")
+    db = database.SessionLocal()
+    try:
+        migrated = backfill_user_sports(db)
+        if migrated:
+            print(f"✅ Deportes migrados a user_sports para {migrated} usuarios")
+    except Exception as e:
+        print(f"❌ Error migrando deportes a user_sports: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+# Índices en memoria de /users/compatible y /users/feed. Con varios workers los
+# índices de cada proceso no ven las escrituras de los demás: en ese caso
+# desactivarlos con PROFILE_INDEX_ENABLED=0 y se resuelve todo contra la base.
+@app.on_event("startup")
+def build_profile_index():
+    if os.getenv("PROFILE_INDEX_ENABLED", "1") != "1":
+        print("ℹ️ Índice de perfiles en memoria deshabilitado, se usa SQL")
+        return
+    db = database.SessionLocal()
+    try:
+        profile_index.build(with_sports(db.query(models.User)).yield_per(1000))
+        profile_matrix.build(with_sports(db.query(models.User)).yield_per(1000))
+        geo_index.build(db.query(models.User).yield_per(1000))
+        # Ranking aproximado por similitud de deportes (ver app/lsh.py)
+        if os.getenv("LSH_ENABLED", "0") == "1":
+            sport_lsh.build(with_sports(db.query(models.User)).yield_per(1000))
+        print("✅ Índices de perfiles construidos")
+    except Exception as e:
+        print(f"❌ Error construyendo índice de perfiles: {e}")
+    finally:
+        db.close()
+
+# Likes write-behind (ver app/like_queue.py): se reprocesa el journal antes de
+# construir el filtro de likes. Solo con un worker.
+@app.on_event("startup")
+def start_like_queue():
+    if os.getenv("LIKE_QUEUE_ENABLED", "0") != "1":
+        return
+    try:
+        like_queue.start(
+            os.getenv("LIKE_QUEUE_PATH", "like_queue.journal"),
+            fsync=os.getenv("LIKE_QUEUE_FSYNC", "1") == "1",
+        )
+        print("✅ Cola de likes write-behind iniciada")
+    except Exception as e:
+        print(f"❌ Error iniciando cola de likes: {e}")
+
+# Filtro de likes en memoria para no consultar el like inverso (ver app/edge_filter.py).
+# Con varios workers desactivarlo con EDGE_FILTER_ENABLED=0.
+@app.on_event("startup")
+def build_edge_filter():
+    if os.getenv("EDGE_FILTER_ENABLED", "1") != "1":
+        print("ℹ️ Filtro de likes deshabilitado")
+        return
+    db = database.SessionLocal()
+    try:
+        edge_filter.build(db.query(models.Like.user_id, models.Like.liked_user_id).yield_per(100000))
+        print(f"✅ Filtro de likes construido con {edge_filter.edges} likes")
+    except Exception as e:
+        print(f"❌ Error construyendo filtro de likes: {e}")
+    finally:
+        db.close()
+
+# Hub de eventos de /ws/chat. REALTIME_BROKER elige el broker ("modulo:Clase");
+# el de memoria solo reparte eventos dentro de este proceso.
+@app.on_event("startup")
+async def start_realtime():
+    realtime.hub.start(asyncio.get_running_loop(), realtime.load_broker(os.getenv("REALTIME_BROKER")))
+
+@app.on_event("shutdown")
+def stop_realtime():
+    realtime.hub.stop()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    password_pool.shutdown()
+
+# Worker que arma los feeds de descubrimiento en segundo plano
+@app.on_event("startup")
+def start_feed_worker():
+    feed_store.start_worker()
+
 # Endpoint raíz para verificar que la API funciona
 @app.get("/")
 def root():
@@ -206,27 +320,10 @@ async def test_upload(file: UploadFile = File(...)):
 
 # Rutas de usuarios
 @app.get("/users/me")
-def read_users_me(current_user: schemas.User = Depends(auth.get_current_user)):
-    # Función para parsear deportes
-    def parse_sports(sports_str):
-        if not sports_str:
-            return []
-        deportes = []
-        for item in sports_str.split(","):
-            item = item.strip()
-            if "(" in item and ")" in item:
-                # Formato: "Fútbol (Avanzado)"
-                nombre, nivel = item.rsplit("(", 1)
-                deportes.append({
-                    "sport": nombre.strip(),
-                    "level": nivel.replace(")", "").strip()
-                })
-            elif item:
-                # Formato simple: "Fútbol"
-                deportes.append({"sport": item, "level": "Principiante"})
-        return deportes
-    
-    return {
+def read_users_me(request: Request, current_user: schemas.User = Depends(auth.get_current_user)):
+    # profile_version cambia con cada edición del perfil (ver app/profile_cards.py)
+    etag = make_etag("users/me", current_user.id, current_user.profile_version)
+    return conditional(request, "/users/me", etag, lambda: {
         "id": current_user.id,
         "username": current_user.username,
         "email": current_user.email,
@@ -236,16 +333,16 @@ def read_users_me(current_user: schemas.User = Depends(auth.get_current_user)):
         "foto_url": current_user.foto_url,
         "video_url": current_user.video_url,
         "deportes_preferidos": current_user.deportes_preferidos or "",
-        "sports": parse_sports(current_user.deportes_preferidos or ""),  # Formato array para el frontend
+        "sports": sports_payload(current_user),  # Formato array para el frontend
         "instagram": current_user.instagram,
         "whatsapp": current_user.whatsapp,
         "phone": current_user.phone
-    }
+    })
 
 @app.put("/users/me", response_model=schemas.User)
 def update_user(
     user_update: schemas.UserUpdate,
-    current_user: schemas.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     db_user = db.query(models.User).filter(models.User.id == current_user.id).first()
@@ -253,127 +350,127 @@ def update_user(
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # Actualizar campos
-    for field, value in user_update.dict(exclude_unset=True).items():
+    update_data = user_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
         setattr(db_user, field, value)
+    if "deportes_preferidos" in update_data:
+        sync_user_sports(db, db_user)
+    bump_version(db_user)
 
     db.commit()
     db.refresh(db_user)
+    profile_events.profile_changed(db_user, update_data.keys())
     return db_user
 
 # Rutas de matches
 @app.get("/matches")
-async def get_matches(
-    current_user: schemas.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+def get_matches(
+    request: Request,
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db),
+    cursor: str = None,
+    limit: int = Query(match_list.DEFAULT_PAGE_SIZE, ge=1, le=match_list.MAX_PAGE_SIZE)
 ):
     try:
         print(f"🔍 Obteniendo matches para usuario {current_user.id}")
+        etag = make_etag("matches", current_user.id, match_list.list_version(db, current_user.id), cursor, limit)
         
-        # Buscar todos los matches donde el usuario actual participa
-        matches = db.query(models.Match).filter(
-            (models.Match.user1_id == current_user.id) | 
-            (models.Match.user2_id == current_user.id)
-        ).all()
-        
-        match_users = []
-        for match in matches:
-            # Determinar quién es el otro usuario en el match
-            other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
-            
-            # Obtener información del otro usuario
-            other_user = db.query(models.User).filter(models.User.id == other_user_id).first()
+        def build():
+            try:
+                page, next_cursor = match_list.match_page(db, current_user.id, cursor, limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             
-            if other_user:
-                # Parsear deportes del usuario
-                def parse_sports(sports_str):
-                    if not sports_str:
-                        return []
-                    deportes = []
-                    for item in sports_str.split(","):
-                        item = item.strip()
-                        if "(" in item and ")" in item:
-                            nombre, nivel = item.rsplit("(", 1)
-                            deportes.append({
-                                "sport": nombre.strip(),
-                                "level": nivel.replace(")", "").strip()
-                            })
-                        elif item:
-                            deportes.append({"sport": item, "level": "Principiante"})
-                    return deportes
-                
-                match_user = {
-                    "id": other_user.id,
-                    "name": other_user.username,
-                    "age": other_user.age or 25,
-                    "location": other_user.location or "Buenos Aires",
-                    "bio": other_user.descripcion or "Amante del deporte",
-                    "foto_url": other_user.foto_url or "",
-                    "video_url": other_user.video_url or "",
-                    "sports": parse_sports(other_user.deportes_preferidos or ""),
+            match_users = [
+                {
+                    **profile_cards.card(other_user, "match"),
                     "match_date": match.created_at.isoformat()
                 }
-                match_users.append(match_user)
+                for match, other_user in page
+            ]
+            
+            print(f"✅ Encontrados {len(match_users)} matches")
+            return {"matches": match_users, "next_cursor": next_cursor}
         
-        print(f"✅ Encontrados {len(match_users)} matches")
-        return {"matches": match_users}
+        return conditional(request, "/matches", etag, build)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error obteniendo matches: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/matches/{user_id}")
-def get_user_matches(user_id: int, db: Session = Depends(get_db)):
-    """Obtiene todos los matches de un usuario con información completa"""
+def get_user_matches(
+    request: Request,
+    user_id: int,
+    db: Session = Depends(get_db),
+    cursor: str = None,
+    limit: int = Query(match_list.DEFAULT_PAGE_SIZE, ge=1, le=match_list.MAX_PAGE_SIZE)
+):
+    """Obtiene los matches de un usuario con información completa, paginados"""
     try:
-        def parse_sports(sports_str):
-            if not sports_str:
-                return []
-            deportes = []
-            for item in sports_str.split(","):
-                item = item.strip()
-                if "(" in item and ")" in item:
-                    nombre, nivel = item.rsplit("(", 1)
-                    deportes.append({
-                        "sport": nombre.strip(),
-                        "level": nivel.replace(")", "").strip()
-                    })
-                elif item:
-                    deportes.append({"sport": item, "level": "Principiante"})
-            return deportes
-        
-        matches = db.query(models.Match).filter(
-            (models.Match.user1_id == user_id) | (models.Match.user2_id == user_id)
-        ).all()
-        
-        matches_data = []
-        
-        for match in matches:
-            # Determinar quién es el otro usuario
-            other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
-            other_user = db.query(models.User).filter(models.User.id == other_user_id).first()
+        etag = make_etag("matches/user", user_id, match_list.list_version(db, user_id), cursor, limit)
+        
+        def build():
+            try:
+                page, next_cursor = match_list.match_page(db, user_id, cursor, limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             
-            if other_user:
-                matches_data.append({
+            matches_data = [
+                {
                     "match_id": match.id,
-                    "user": {
-                        "id": other_user.id,
-                        "username": other_user.username,
-                        "age": other_user.age,
-                        "location": other_user.location,
-                        "descripcion": other_user.descripcion,
-                        "foto_url": other_user.foto_url,
-                        "video_url": other_user.video_url,
-                        "deportes_preferidos": other_user.deportes_preferidos,
-                        "sports": parse_sports(other_user.deportes_preferidos or ""),
-                        "instagram": other_user.instagram,
-                        "whatsapp": other_user.whatsapp,
-                        "phone": other_user.phone
-                    },
+                    "user": profile_cards.card(other_user, "detail"),
                     "created_at": match.created_at
-                })
+                }
+                for match, other_user in page
+            ]
+            
+            return {"matches": matches_data, "next_cursor": next_cursor}
+        
+        return conditional(request, "/matches/{user_id}", etag, build)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bandeja de chats: cada match con el otro usuario, el último mensaje y los no leídos
+@app.get("/inbox")
+def get_inbox(
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db),
+    cursor: str = None,
+    limit: int = Query(chat.DEFAULT_PAGE_SIZE, ge=1, le=chat.MAX_PAGE_SIZE)
+):
+    try:
+        try:
+            page, next_cursor = chat.inbox_page(db, current_user.id, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        chats = []
+        for entry in page:
+            last_message = entry.last_message
+            chats.append({
+                "match_id": entry.match.id,
+                "user": profile_cards.card(entry.other_user, "match"),
+                "match_date": entry.match.created_at.isoformat(),
+                "last_activity_at": entry.match.last_activity_at.isoformat(),
+                "last_message": {
+                    "id": last_message.id,
+                    "content": last_message.content,
+                    "sender_id": last_message.sender_id,
+                    "created_at": last_message.created_at,
+                } if last_message else None,
+                "unread_count": entry.unread,
+            })
         
-        return {"matches": matches_data}
+        return {"inbox": chats, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
+        print(f"❌ Error obteniendo bandeja de chats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint para obtener usuarios compatibles
@@ -386,197 +483,197 @@ async def get_compatible_users_route(
     max_age: int = 65,
     location: str = None,
     sports: str = None,
-    distance: int = 50
+    distance: int = Query(50, gt=0),
+    # Paginación
+    cursor: str = None,
+    limit: int = Query(discovery.DEFAULT_PAGE_SIZE, ge=1, le=discovery.MAX_PAGE_SIZE)
 ):
     try:
         print(f"🔍 Buscando usuarios compatibles para: {current_user.username}")
-        print(f"📊 Filtros aplicados: edad {min_age}-{max_age}, ubicación: {location}, deportes: {sports}")
-        
-        # Función para parsear deportes
-        def parse_sports(sports_str):
-            if not sports_str:
-                return []
-            deportes = []
-            for item in sports_str.split(","):
-                item = item.strip()
-                if "(" in item and ")" in item:
-                    # Formato: "Fútbol (Avanzado)"
-                    nombre, nivel = item.rsplit("(", 1)
-                    deportes.append({
-                        "sport": nombre.strip(),
-                        "level": nivel.replace(")", "").strip()
-                    })
-                elif item:
-                    # Formato simple: "Fútbol"
-                    deportes.append({"sport": item, "level": "Principiante"})
-            return deportes
-        
-        # Obtener todos los usuarios excepto el actual
-        users = db.query(models.User).filter(models.User.id != current_user.id).all()
-        
-        # Parsear deportes filtrados
-        filtered_sports = []
-        if sports:
-            filtered_sports = parse_sports(sports)
+        print(f"📊 Filtros aplicados: edad {min_age}-{max_age}, ubicación: {location}, deportes: {sports}, distancia: {distance} km")
+
+        # El radio solo se aplica si el usuario cargó sus coordenadas
+        origin = (current_user.latitude, current_user.longitude) if has_coordinates(current_user) else None
+        
+        try:
+            page, next_cursor = discovery.search_page(
+                db,
+                current_user.id,
+                min_age,
+                max_age,
+                location=location,
+                sport_names=parse_sport_names(sports) if sports else None,
+                cursor=cursor,
+                limit=limit,
+                seen=seen_store.get(db, current_user.id),
+                origin=origin,
+                max_distance_km=distance,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        filtered_sport_names = set(parse_sport_names(sports)) if sports else set()
         
         compatible_users = []
-        for user in users:
-            # Aplicar filtro de edad
-            user_age = user.age or 25
-            if user_age < min_age or user_age > max_age:
-                continue
-            
-            # Aplicar filtro de ubicación
-            if location and user.location and user.location.lower() != location.lower():
-                continue
-            
-            # Aplicar filtro de deportes
-            user_sports = parse_sports(user.deportes_preferidos or "")
-            if filtered_sports:
-                # Verificar si el usuario tiene al menos uno de los deportes filtrados
-                user_sport_names = [s.get("sport", "").lower() for s in user_sports]
-                filtered_sport_names = [s.get("sport", "").lower() for s in filtered_sports]
-                
-                has_matching_sport = any(
-                    user_sport in filtered_sport_names or user_sport in [fs.lower() for fs in filtered_sport_names]
-                    for user_sport in user_sport_names
-                )
-                
-                if not has_matching_sport:
-                    continue
-            
-            # Calcular score de compatibilidad basado en deportes en común
-            compatibility_score = 60  # Score base
-            common_sports = []
-            
-            if filtered_sports and user_sports:
-                for user_sport in user_sports:
-                    for filtered_sport in filtered_sports:
-                        if user_sport.get("sport", "").lower() == filtered_sport.get("sport", "").lower():
-                            common_sports.append(user_sport.get("sport"))
-                            compatibility_score += 10  # +10 por deporte en común
-            
-            # Asegurar que el score no exceda 95
-            compatibility_score = min(compatibility_score, 95)
+        for compatibility_score, user in page:
+            card = profile_cards.card(user, "discovery")
+            distance_km = distance_between(current_user, user)
+            common_sports = [
+                s["sport"] for s in card["sports"]
+                if s["sport"].lower() in filtered_sport_names
+            ]
             
             compatible_user = {
-                "id": user.id,
-                "name": user.username,
-                "age": user_age,
-                "location": user.location or "Buenos Aires",
-                "bio": user.descripcion or "Amante del deporte",
-                "foto_url": user.foto_url or "https://images.unsplash.com/photo-1535713875002-d1d0cf377fde?w=150&h=150&fit=crop&crop=face",
-                "video_url": user.video_url or "",
-                "sports": user_sports,  # Array de objetos
+                **card,
                 "compatibility_score": compatibility_score,
-                "common_sports": common_sports
+                "common_sports": common_sports,
+                "distance_km": round(distance_km, 1) if distance_km is not None else None
             }
             compatible_users.append(compatible_user)
         
         print(f"✅ Encontrados {len(compatible_users)} usuarios compatibles después de aplicar filtros")
-        return {"users": compatible_users}
+        return {"users": compatible_users, "next_cursor": next_cursor}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error obteniendo usuarios compatibles: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Feed de descubrimiento precalculado (ordenado por compatibilidad)
+@app.get("/users/feed")
+def get_feed(
+    current_user: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+    limit: int = Query(discovery.DEFAULT_PAGE_SIZE, ge=1, le=discovery.MAX_PAGE_SIZE)
+):
+    try:
+        entries = feed_store.page(db, current_user, limit)
+        users = {
+            user.id: user
+            for user in with_sports(db.query(models.User)).filter(models.User.id.in_([e.user_id for e in entries]))
+        }
+        
+        feed_users = []
+        for entry in entries:
+            user = users.get(entry.user_id)
+            if not user:
+                continue
+            feed_users.append({
+                **profile_cards.card(user, "discovery"),
+                "compatibility_score": entry.score,
+                "common_sports": entry.common_sports
+            })
+        return {"users": feed_users}
+    except Exception as e:
+        print(f"❌ Error obteniendo feed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Endpoint para dar like a un usuario
 @app.post("/users/like/{user_id}")
-async def like_user(
+def like_user(
     user_id: int,
-    current_user: schemas.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     try:
         print(f"❤️ Usuario {current_user.id} dando like a usuario {user_id}")
         
-        # Verificar que el usuario objetivo existe
-        target_user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not target_user:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        
         # Verificar que no se está dando like a sí mismo
         if current_user.id == user_id:
             raise HTTPException(status_code=400, detail="No puedes darte like a ti mismo")
         
-        # Verificar si ya existe un like
-        existing_like = db.query(models.Like).filter(
-            models.Like.user_id == current_user.id,
-            models.Like.liked_user_id == user_id
-        ).first()
+        # Like y match (si es mutuo) en una sola transacción, o al journal en modo write-behind
+        try:
+            if like_queue.enabled:
+                result = like_queue.record_like(db, current_user.id, user_id)
+            else:
+                result = swipes.record_like(db, current_user.id, user_id)
+        except swipes.TargetNotFound:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        db.commit()
+        seen_store.add(current_user.id, user_id)
+        feed_store.pop(current_user.id, user_id)
         
-        if existing_like:
-            # Revisar si ya hay match
-            match_already_exists = db.query(models.Match).filter(
-                ((models.Match.user1_id == current_user.id) & (models.Match.user2_id == user_id)) |
-                ((models.Match.user1_id == user_id) & (models.Match.user2_id == current_user.id))
-            ).first()
-            is_match = False
-            if match_already_exists:
-                is_match = True
+        if not result.created:
             return {
                 "success": True,
-                "is_match": is_match,
-                "message": "Ya le diste like a este usuario" + (" y es un match!" if is_match else "")
+                "is_match": result.is_match,
+                "message": "Ya le diste like a este usuario" + (" y es un match!" if result.is_match else "")
             }
         
-        # Crear el like
-        new_like = models.Like(
-            user_id=current_user.id,
-            liked_user_id=user_id
-        )
-        db.add(new_like)
-
-        # Verificar si hay match (like mutuo)
-        mutual_like = db.query(models.Like).filter(
-            models.Like.user_id == user_id,
-            models.Like.liked_user_id == current_user.id
-        ).first()
-
-        is_match = False
-        match_already_exists = db.query(models.Match).filter(
-            ((models.Match.user1_id == current_user.id) & (models.Match.user2_id == user_id)) |
-            ((models.Match.user1_id == user_id) & (models.Match.user2_id == current_user.id))
-        ).first()
-        if mutual_like and not match_already_exists:
-            print(f"Intentando crear match entre {current_user.id} y {user_id}")
-            new_match = models.Match(
-                user1_id=min(current_user.id, user_id),
-                user2_id=max(current_user.id, user_id)
-            )
-            db.add(new_match)
-            is_match = True
-            print(f"🎉 ¡MATCH creado! Entre usuario {current_user.id} y usuario {user_id}")
-        elif mutual_like and match_already_exists:
-            is_match = True
-            print(f"⚠️ Match ya existía entre usuario {current_user.id} y usuario {user_id}")
-
-        db.commit()  # Solo un commit aquí, después de todos los adds
-
-        # Imprimir el contenido de la tabla matches
-        all_matches = db.query(models.Match).all()
-        print(f"📋 Contenido actual de la tabla matches:")
-        for m in all_matches:
-            print(f"Match: id={m.id}, user1_id={m.user1_id}, user2_id={m.user2_id}, created_at={m.created_at}")
-
+        if result.is_match:
+            print(f"🎉 ¡MATCH! Entre usuario {current_user.id} y usuario {user_id} (match {result.match_id})")
+            realtime.publish_match(result.match_id, current_user.id, user_id)
+        
         return {
             "success": True,
-            "is_match": is_match,
-            "message": "¡Es un match! 🎉" if is_match else "Like registrado"
+            "is_match": result.is_match,
+            "message": "¡Es un match! 🎉" if result.is_match else "Like registrado"
         }
         
     except HTTPException:
+        db.rollback()
         raise
     except Exception as e:
         print(f"❌ Error procesando like: {e}")
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Likes y dislikes en lote: el cliente junta los swipes y los manda juntos
+@app.post("/users/swipes")
+def apply_swipes(
+    batch: schemas.SwipeBatch,
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    try:
+        actions = [(swipe.user_id, swipe.action) for swipe in batch.swipes]
+        print(f"👆 Usuario {current_user.id} enviando {len(actions)} swipes")
+        
+        # Los likes write-behind tienen que estar en la tabla antes de leerla
+        like_queue.drain()
+        results = swipes.apply_swipes(db, current_user.id, actions)
+        db.commit()
+        for result in results:
+            if result.success:
+                seen_store.add(current_user.id, result.user_id)
+                feed_store.pop(current_user.id, result.user_id)
+        
+        new_matches = [
+            {"match_id": result.match_id, "user_id": result.user_id}
+            for result in results if result.new_match
+        ]
+        if new_matches:
+            print(f"🎉 {len(new_matches)} matches nuevos para usuario {current_user.id}")
+            for new_match in new_matches:
+                realtime.publish_match(new_match["match_id"], current_user.id, new_match["user_id"])
+        
+        return {
+            "results": [
+                {
+                    "user_id": result.user_id,
+                    "action": result.action,
+                    "success": result.success,
+                    "is_match": result.is_match,
+                    "match_id": result.match_id,
+                    "message": result.message
+                }
+                for result in results
+            ],
+            "new_matches": new_matches
+        }
+        
+    except Exception as e:
+        print(f"❌ Error procesando swipes: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Endpoint para dar dislike a un usuario
 @app.post("/users/dislike/{user_id}")
 async def dislike_user(
     user_id: int,
-    current_user: schemas.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     try:
@@ -591,7 +688,8 @@ async def dislike_user(
         if current_user.id == user_id:
             raise HTTPException(status_code=400, detail="No puedes rechazarte a ti mismo")
         
-        # Eliminar like si existe
+        # Eliminar like si existe (con los likes write-behind ya escritos)
+        like_queue.drain()
         existing_like = db.query(models.Like).filter(
             models.Like.user_id == current_user.id,
             models.Like.liked_user_id == user_id
@@ -599,8 +697,20 @@ async def dislike_user(
         
         if existing_like:
             db.delete(existing_like)
+            edge_filter.discard(current_user.id, user_id)
+        
+        # Registrar el dislike para no volver a mostrarlo en descubrimiento
+        existing_dislike = db.query(models.Dislike).filter(
+            models.Dislike.user_id == current_user.id,
+            models.Dislike.disliked_user_id == user_id
+        ).first()
+        
+        if not existing_dislike:
+            db.add(models.Dislike(user_id=current_user.id, disliked_user_id=user_id))
         
         db.commit()
+        seen_store.add(current_user.id, user_id)
+        feed_store.pop(current_user.id, user_id)
         
         print("✅ Dislike registrado")
         
@@ -620,7 +730,7 @@ async def dislike_user(
 @app.post("/upload-profile-picture")
 async def upload_profile_picture(
     file: UploadFile = File(...),
-    current_user: schemas.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     print(f"📸 Iniciando subida de foto: {file.filename}")
@@ -670,8 +780,10 @@ async def upload_profile_picture(
         
         db_user = db.query(models.User).filter(models.User.id == current_user.id).first()
         db_user.foto_url = foto_url
+        bump_version(db_user)
         db.commit()
         db.refresh(db_user)
+        profile_events.profile_changed(db_user, {"foto_url"})
         
         print(f"✅ Foto subida exitosamente para usuario {current_user.username}")
         return {"message": "Foto subida exitosamente", "foto_url": foto_url}
@@ -683,7 +795,7 @@ async def upload_profile_picture(
 @app.post("/upload-sport-video")
 async def upload_sport_video(
     file: UploadFile = File(...),
-    current_user: schemas.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     print(f"🎥 Iniciando subida de video: {file.filename}")
@@ -733,8 +845,10 @@ async def upload_sport_video(
         
         db_user = db.query(models.User).filter(models.User.id == current_user.id).first()
         db_user.video_url = video_url
+        bump_version(db_user)
         db.commit()
         db.refresh(db_user)
+        profile_events.profile_changed(db_user, {"video_url"})
         
         print(f"✅ Video subido exitosamente para usuario {current_user.username}")
         return {"message": "Video subido exitosamente", "video_url": video_url}
@@ -777,7 +891,7 @@ BASE_URL = get_base_url()
 async def register(user_data: schemas.UserCreate):
     try:
         existing_user = db.query(models.User).filter(
-            (models.User.email == user_data.email) | (models.User.username == user_data.username)
+            (func.lower(models.User.email) == user_data.email.lower()) | (models.User.username == user_data.username)
         ).first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Usuario o email ya existe")
@@ -789,14 +903,18 @@ async def register(user_data: schemas.UserCreate):
             password=hashed_password,
             age=user_data.age,
             location=user_data.location,
+            latitude=user_data.latitude,
+            longitude=user_data.longitude,
             descripcion=user_data.bio or user_data.descripcion,
             deportes_preferidos=user_data.sports or user_data.deportes_preferidos,
             foto_url=user_data.foto_url,
             video_url=user_data.video_url
         )
+        sync_user_sports(db, new_user)
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
+        profile_events.profile_changed(new_user)
         token = create_access_token(data={"sub": new_user.email})
         return {
             "access_token": token,
@@ -823,7 +941,7 @@ async def register(user_data: schemas.UserCreate):
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
         user = db.query(models.User).filter(
-            (models.User.email == form_data.username) | (models.User.username == form_data.username)
+            (func.lower(models.User.email) == form_data.username.lower()) | (models.User.username == form_data.username)
         ).first()
         if not user:
             raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
@@ -874,7 +992,7 @@ async def test_register():
             return {"error": "Usuario ya existe"}
         
         # Crear nuevo usuario
-        hashed_password = pwd_context.hash(test_data["password"])
+        hashed_password = await password_pool.hash_async(test_data["password"])
         
         new_user = models.User(
             username=test_data["username"],
@@ -969,7 +1087,7 @@ async def create_test_users(db: Session = Depends(get_db)):
             }
         ]
         
-        created_users = []
+        missing_users = []
         for user_data in test_users:
             # Verificar si el usuario ya existe
             existing_user = db.query(models.User).filter(
@@ -979,10 +1097,14 @@ async def create_test_users(db: Session = Depends(get_db)):
             if existing_user:
                 print(f"⚠️ Usuario {user_data['username']} ya existe")
                 continue
-            
-            # Crear hash de la contraseña
-            hashed_password = pwd_context.hash(user_data["password"])
-            
+            missing_users.append(user_data)
+        
+        # Todos los hashes en paralelo en el pool de contraseñas
+        hashes = await run_in_threadpool(password_pool.hash_many, [user_data["password"] for user_data in missing_users])
+        
+        created_users = []
+        new_users = []
+        for user_data, hashed_password in zip(missing_users, hashes):
             # Crear el usuario
             new_user = models.User(
                 username=user_data["username"],
@@ -995,11 +1117,15 @@ async def create_test_users(db: Session = Depends(get_db)):
                 foto_url=user_data["foto_url"],
                 video_url=user_data["video_url"]
             )
+            sync_user_sports(db, new_user)
             
             db.add(new_user)
+            new_users.append(new_user)
             created_users.append(user_data["username"])
         
         db.commit()
+        for new_user in new_users:
+            profile_events.profile_changed(new_user)
         
         print(f"✅ Usuarios de prueba creados: {created_users}")
         
@@ -1023,47 +1149,17 @@ async def create_test_users(db: Session = Depends(get_db)):
 
 # Endpoint para crear tablas específicas
 @app.post("/create-likes-matches-tables")
-async def create_likes_matches_tables(db: Session = Depends(get_db)):
+def create_likes_matches_tables():
+    # Las tablas y sus índices los crean las migraciones (ver app/migrations.py)
     try:
-        print("🔧 Creando tablas likes y matches específicamente...")
-        
-        # Crear tabla likes
-        create_likes_table = """
-        CREATE TABLE IF NOT EXISTS likes (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            liked_user_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (liked_user_id) REFERENCES users(id)
-        );
-        """
-        
-        # Crear tabla matches
-        create_matches_table = """
-        CREATE TABLE IF NOT EXISTS matches (
-            id SERIAL PRIMARY KEY,
-            user1_id INTEGER NOT NULL,
-            user2_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user1_id) REFERENCES users(id),
-            FOREIGN KEY (user2_id) REFERENCES users(id)
-        );
-        """
-        
-        # Ejecutar las consultas SQL
-        from sqlalchemy import text
-        
-        db.execute(text(create_likes_table))
-        db.execute(text(create_matches_table))
-        db.commit()
-        
+        applied = migrations.upgrade(engine)
         print("✅ Tablas likes y matches creadas exitosamente")
-        return {"message": "Tablas likes y matches creadas exitosamente"}
-        
+        return {
+            "message": "Tablas likes y matches creadas exitosamente",
+            "migrations_applied": [migration.version for migration in applied],
+        }
     except Exception as e:
         print(f"❌ Error creando tablas: {e}")
-        db.rollback()
         return {"error": str(e)}
 
 # Endpoint para obtener estadísticas de la base de datos
@@ -1091,6 +1187,19 @@ async def get_db_stats(db: Session = Depends(get_db)):
             "error": str(e)
         }
 
+# Contadores de los caches en memoria de este proceso
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "profile_cards": profile_cards.stats(),
+        "edge_filter": edge_filter.stats(),
+        "like_queue": like_queue.stats(),
+        "etag": etag_stats.stats(),
+        "realtime": realtime.hub.stats(),
+        "passwords": password_pool.stats(),
+        "principals": principal_cache.stats()
+    }
+
 # Endpoint para limpiar usuarios de prueba
 @app.delete("/test/clean-test-users")
 async def clean_test_users(db: Session = Depends(get_db)):
@@ -1113,6 +1222,7 @@ async def clean_test_users(db: Session = Depends(get_db)):
         ]
         
         deleted_users = []
+        deleted_ids = []
         deleted_likes = 0
         deleted_matches = 0
         
@@ -1134,20 +1244,31 @@ async def clean_test_users(db: Session = Depends(get_db)):
                 for like in likes_to_delete:
                     db.delete(like)
                     deleted_likes += 1
-                
+
+                # Eliminar dislikes relacionados (dados y recibidos)
+                db.query(models.Dislike).filter(
+                    (models.Dislike.user_id == user.id) | (models.Dislike.disliked_user_id == user.id)
+                ).delete(synchronize_session=False)
+
                 # Eliminar matches relacionados
                 matches_to_delete = db.query(models.Match).filter(
                     (models.Match.user1_id == user.id) | (models.Match.user2_id == user.id)
                 ).all()
                 for match in matches_to_delete:
+                    # Mensajes y mensajes archivados del match
+                    db.query(models.Message).filter(models.Message.match_id == match.id).delete()
+                    db.query(models.MessageArchive).filter(models.MessageArchive.match_id == match.id).delete()
                     db.delete(match)
                     deleted_matches += 1
                 
                 # Eliminar el usuario
                 db.delete(user)
                 deleted_users.append(f"{user.username} ({user.email})")
+                deleted_ids.append(user.id)
         
         db.commit()
+        for user_id in deleted_ids:
+            profile_events.profile_removed(user_id)
         
         print(f"✅ Usuarios de prueba eliminados: {len(deleted_users)}")
         print(f"✅ Likes eliminados: {deleted_likes}")
@@ -1172,45 +1293,237 @@ async def clean_test_users(db: Session = Depends(get_db)):
 def create_message(message: dict, db: Session = Depends(get_db)):
     """Crea un nuevo mensaje"""
     try:
-        new_message = models.Message(
-            match_id=message["match_id"],
-            sender_id=message["sender_id"],
-            content=message["content"]
-        )
-        db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
-        return {"message": "Mensaje enviado", "id": new_message.id}
+        try:
+            new_message = chat.send_message(db, message["match_id"], message["sender_id"], message["content"])
+        except chat.MatchNotFound:
+            raise HTTPException(status_code=404, detail="Match no encontrado")
+        except chat.NotParticipant:
+            raise HTTPException(status_code=403, detail="El usuario no es parte de este match")
+        return {"message": "Mensaje enviado", "id": new_message["id"]}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/messages/{match_id}")
-def get_match_messages(match_id: int, db: Session = Depends(get_db)):
-    """Obtiene todos los mensajes de un match"""
+def get_match_messages(
+    request: Request,
+    match_id: int,
+    db: Session = Depends(get_db),
+    # Cursores: before_id para mensajes anteriores, after_id para los nuevos desde el último visto
+    before_id: int = None,
+    after_id: int = None,
+    limit: int = Query(chat.DEFAULT_HISTORY_SIZE, ge=1, le=chat.MAX_HISTORY_SIZE)
+):
+    """Obtiene una página de mensajes de un match (por defecto los más nuevos)"""
     try:
-        messages = db.query(models.Message).filter(
-            models.Message.match_id == match_id
-        ).order_by(models.Message.created_at).all()
-        
-        messages_data = []
-        for msg in messages:
-            sender = db.query(models.User).filter(models.User.id == msg.sender_id).first()
-            messages_data.append({
-                "id": msg.id,
-                "content": msg.content,
-                "created_at": msg.created_at,
-                "is_read": msg.is_read,
-                "sender": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "foto_url": sender.foto_url
-                } if sender else None
-            })
+        if before_id is not None and after_id is not None:
+            raise HTTPException(status_code=400, detail="Usar before_id o after_id, no ambos")
+        
+        found = chat.participants(db, match_id)
+        etag = make_etag("messages", match_id, chat.history_version(found), before_id, after_id, limit)
+        
+        def build():
+            if found is None:
+                return {"messages": [], "has_more": False}
+            messages, has_more = chat.history_page(
+                db, match_id, before_id, after_id, limit, found.match.archived_through_id
+            )
+            
+            # Un match tiene solo dos emisores posibles
+            senders = {user.id: profile_cards.card(user, "sender") for user in (found.user1, found.user2)}
+            others = {msg.sender_id for msg in messages} - senders.keys()
+            if others:
+                senders.update(
+                    (user.id, profile_cards.card(user, "sender"))
+                    for user in db.query(models.User).filter(models.User.id.in_(others))
+                )
+            
+            messages_data = [
+                {
+                    "id": msg.id,
+                    "content": msg.content,
+                    "created_at": msg.created_at,
+                    "is_read": chat.is_read(found.match, msg),
+                    "sender": senders.get(msg.sender_id)
+                }
+                for msg in messages
+            ]
+            
+            return {"messages": messages_data, "has_more": has_more}
         
-        return {"messages": messages_data}
+        return conditional(request, "/messages/{match_id}", etag, build)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Marca como leídos los mensajes del otro participante hasta last_read_id
+@app.post("/messages/{match_id}/read")
+def mark_messages_read(
+    match_id: int,
+    body: schemas.MessagesRead = schemas.MessagesRead(),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    try:
+        try:
+            last_read_id, unread = chat.mark_read(db, match_id, current_user.id, body.last_read_id)
+        except chat.MatchNotFound:
+            raise HTTPException(status_code=404, detail="Match no encontrado")
+        except chat.NotParticipant:
+            raise HTTPException(status_code=403, detail="No eres parte de este match")
+        return {"match_id": match_id, "last_read_id": last_read_id, "unread_count": unread}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
+        print(f"❌ Error marcando mensajes como leídos: {e}")
+        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Chat en tiempo real (ver app/realtime.py). El token va en ?token= (los
+# navegadores no mandan headers en un WebSocket) o en Authorization: Bearer.
+# El cliente manda {"type": "message", "match_id", "content", "client_id"?} o
+# {"type": "ping"}; el servidor manda eventos "message", "match", "sent",
+# "pong" y "error".
+def _bearer_token(connection, token: str = None) -> str:
+    """Token de ?token= o del header Authorization: Bearer"""
+    authorization = connection.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    return token or ""
+
+def _open_event_session(token: str):
+    """Usuario del token y sus matches; la sesión de base se cierra enseguida"""
+    db = database.SessionLocal()
+    try:
+        user = auth.authenticate_principal(token, db)
+        match_ids = [
+            match_id for (match_id,) in db.query(models.Match.id).filter(
+                (models.Match.user1_id == user.id) | (models.Match.user2_id == user.id)
+            )
+        ]
+        return user.id, match_ids
+    finally:
+        db.close()
+
+def _send_chat_message(user_id: int, match_id: int, content: str):
+    db = database.SessionLocal()
+    try:
+        return chat.send_message(db, match_id, user_id, content)
+    finally:
+        db.close()
+
+async def _pump_events(websocket: WebSocket, subscription: realtime.Subscription):
+    while True:
+        item = await subscription.next_event()
+        if item is None:
+            # El cliente no leía y se llenó su cola
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return
+        await websocket.send_json(item[1])
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, token: str = None):
+    try:
+        user_id, match_ids = await run_in_threadpool(_open_event_session, _bearer_token(websocket, token))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = realtime.hub.subscribe(
+        user_id,
+        [realtime.user_channel(user_id)] + [realtime.match_channel(match_id) for match_id in match_ids],
+    )
+    # Un solo escritor por socket: las respuestas también pasan por la cola
+    pump = asyncio.create_task(_pump_events(websocket, subscription))
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                kind = data.get("type")
+            except (ValueError, AttributeError):
+                subscription.offer({"type": "error", "detail": "JSON inválido"})
+                continue
+            if kind == "ping":
+                subscription.offer({"type": "pong"})
+            elif kind == "message":
+                content = data.get("content")
+                if not isinstance(content, str) or not content.strip() or not isinstance(data.get("match_id"), int):
+                    subscription.offer({"type": "error", "detail": "Faltan match_id o content"})
+                    continue
+                try:
+                    payload = await run_in_threadpool(_send_chat_message, user_id, data["match_id"], content)
+                    subscription.offer({"type": "sent", "client_id": data.get("client_id"), "message": payload})
+                except chat.MatchNotFound:
+                    subscription.offer({"type": "error", "detail": "Match no encontrado"})
+                except chat.NotParticipant:
+                    subscription.offer({"type": "error", "detail": "No eres parte de este match"})
+            else:
+                subscription.offer({"type": "error", "detail": f"Tipo de mensaje desconocido: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pump.cancel()
+        realtime.hub.unsubscribe(subscription)
+
+# Server-Sent Events con los mismos eventos que /ws/chat, para clientes sin
+# WebSocket. EventSource no manda headers: el token va en ?token=. Al
+# reconectar se reenvían los eventos posteriores a Last-Event-ID; si ya no
+# están en el buffer se manda "resync" y el cliente vuelve a pedir sus datos.
+# Sin Depends(get_db): una conexión abierta no retiene una conexión a la base.
+SSE_HEARTBEAT_SECONDS = 15
+
+def _sse(event: dict, event_id: str = None) -> str:
+    lines = f"id: {event_id}\n" if event_id else ""
+    return lines + f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/events")
+async def stream_events(request: Request, token: str = None):
+    user_id, match_ids = await run_in_threadpool(_open_event_session, _bearer_token(request, token))
+    last_event_id = request.headers.get("last-event-id")
+    
+    subscription = realtime.hub.subscribe(
+        user_id,
+        [realtime.user_channel(user_id)] + [realtime.match_channel(match_id) for match_id in match_ids],
+    )
+    # Sin await entre subscribe y replay: ningún evento queda duplicado ni perdido
+    missed, complete = realtime.hub.replay(subscription.channels, last_event_id) if last_event_id else ([], True)
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            if not complete:
+                yield _sse({"type": "resync"})
+            for event_id, event in missed:
+                yield _sse(event, event_id)
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.next_event(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión en proxies
+                    yield ": heartbeat\n\n"
+                    continue
+                if item is None:
+                    # El cliente no leía; al reconectar retoma con Last-Event-ID
+                    return
+                event_id, event = item
+                yield _sse(event, event_id)
+        finally:
+            realtime.hub.unsubscribe(subscription)
+    
+    # Si el cliente se va antes de que empiece el stream, el finally no corre.
+    # La tarea es async para que corra en el event loop, como todo el hub
+    async def close_subscription():
+        realtime.hub.unsubscribe(subscription)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }, background=BackgroundTask(close_subscription))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,89 @@
+"""
+Listado paginado de matches para /matches y /matches/{user_id}.
+
+Una sola consulta une matches con el "otro" usuario de cada par (CASE sobre
+user1_id/user2_id) y los deportes se cargan con una consulta más para toda la
+página: dos consultas por página sin importar cuántos matches tenga el usuario.
+
+Las páginas van del match más nuevo al más viejo, ordenadas por
+(created_at, id), y se recorren con un cursor opaco con el último par
+devuelto. Las columnas filtradas usan uq_matches_users (user1_id) e
+ix_matches_user2_id.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from . import models
+from .sports import with_sports
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, match_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), match_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodifica un cursor de encode_cursor; lanza ValueError si es inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, match_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(match_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def other_user_id(user_id: int):
+    """Expresión SQL con el id del otro usuario de cada match de `user_id`"""
+    return case((models.Match.user1_id == user_id, models.Match.user2_id), else_=models.Match.user1_id)
+
+
+def list_version(db: Session, user_id: int) -> Tuple[int, Optional[int], int]:
+    """
+    Marca de versión de los matches de `user_id` para el ETag: cantidad, id
+    máximo y suma de profile_version de los otros usuarios (cambia si alguno
+    edita su perfil). Una consulta agregada, sin deportes ni serialización.
+    """
+    count, max_id, versions = (
+        db.query(func.count(models.Match.id), func.max(models.Match.id), func.sum(models.User.profile_version))
+        .join(models.User, models.User.id == other_user_id(user_id))
+        .filter(or_(models.Match.user1_id == user_id, models.Match.user2_id == user_id))
+        .one()
+    )
+    return count, max_id, versions or 0
+
+
+def match_page(
+    db: Session, user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+) -> Tuple[List[Tuple[models.Match, models.User]], Optional[str]]:
+    """Devuelve ([(match, otro usuario)], next_cursor), del más nuevo al más viejo"""
+    query = (
+        with_sports(db.query(models.Match, models.User))
+        .join(models.User, models.User.id == other_user_id(user_id))
+        .filter(or_(models.Match.user1_id == user_id, models.Match.user2_id == user_id))
+    )
+    if cursor:
+        created_at, match_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            models.Match.created_at < created_at,
+            and_(models.Match.created_at == created_at, models.Match.id < match_id),
+        ))
+    # Se pide uno más para saber si hay otra página
+    rows = (
+        query.order_by(models.Match.created_at.desc(), models.Match.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return [(match, user) for match, user in rows], next_cursor
@@ -1,7 +1,13 @@
 import json
 from sqlalchemy.orm import Session
 from . import models
-from typing import List, Dict, Any
+from .geo import distance_between, proximity_points
+from .lsh import sport_lsh
+from .scoring import profile_matrix
+from .seen import SeenSet
+from .sports import with_sports
+from typing import List, Dict, Any, Optional, Tuple
+import heapq
 import math
 from datetime import datetime
 
@@ -12,14 +18,10 @@ def calculate_compatibility_score(user1: models.User, user2: models.User) -> flo
     score = 0.0
     
     # 1. Deportes en común (40 puntos)
-    sports1_str = user1.deportes_preferidos
-    sports2_str = user2.deportes_preferidos
-    sports1 = sports1_str.split(',') if sports1_str else []
-    sports2 = sports2_str.split(',') if sports2_str else []
+    set1 = {sport.key for sport in user1.sport_levels}
+    set2 = {sport.key for sport in user2.sport_levels}
 
-    if sports1 and sports2:
-        set1 = set([s.strip().lower() for s in sports1])
-        set2 = set([s.strip().lower() for s in sports2])
+    if set1 and set2:
         if set1 == set2:
             score += 40
         else:
@@ -40,6 +42,11 @@ def calculate_compatibility_score(user1: models.User, user2: models.User) -> flo
             score += 15
         elif age_diff <= 15:
             score += 10
+
+    # 4. Cercanía (10 puntos)
+    distance = distance_between(user1, user2)
+    if distance is not None:
+        score += proximity_points(distance)
     
     return min(score, 100.0)
 
@@ -47,32 +54,85 @@ def get_common_sports(user1: models.User, user2: models.User) -> List[str]:
     """
     Obtiene los deportes en común entre dos usuarios
     """
-    sports1_str = user1.deportes_preferidos
-    sports2_str = user2.deportes_preferidos
-    sports1 = sports1_str.split(',') if sports1_str else []
-    sports2 = sports2_str.split(',') if sports2_str else []
-    
-    if not sports1 or not sports2:
-        return []
-    
-    return list(set([s.strip() for s in sports1]) & set([s.strip() for s in sports2]))
+    keys2 = {sport.key for sport in user2.sport_levels}
+    return [
+        f"{sport.name} ({sport.level})" if sport.level else sport.name
+        for sport in user1.sport_levels
+        if sport.key in keys2
+    ]
+
+# Usuarios leídos por lote al recorrer la tabla en get_compatible_users
+STREAM_BATCH_SIZE = 1000
 
-def get_compatible_users(db: Session, current_user: models.User, limit: int = 20) -> List[Dict[str, Any]]:
+# En modo aproximado se rankean con el score completo limit * este factor candidatos de LSH
+LSH_CANDIDATES_FACTOR = 20
+
+def get_compatible_users(
+    db: Session, current_user: models.User, limit: int = 20, seen: Optional[SeenSet] = None
+) -> List[Dict[str, Any]]:
     """
-    Obtiene usuarios compatibles para el usuario actual
+    Obtiene los `limit` usuarios más compatibles para el usuario actual, sin
+    los usuarios de `seen`. Empates ordenados por id ascendente.
+
+    Con el índice LSH construido (LSH_ENABLED=1) solo se rankean los usuarios
+    con deportes parecidos: resultado aproximado en tiempo sublineal.
     """
-    compatible_users = db.query(models.User).filter(models.User.id != current_user.id).all()
-    users_with_scores = []
-    for user in compatible_users:
-        score = calculate_compatibility_score(current_user, user)
-        common_sports = get_common_sports(current_user, user)
-        users_with_scores.append({
+    top = _approximate_top_k(db, current_user, limit, seen) if sport_lsh.ready else None
+    if top is None and profile_matrix.ready:
+        # Snapshot en memoria ya construido (lo mantiene el feed): scoring por lotes
+        ids, scores = profile_matrix.top(current_user, limit, seen.ids if seen is not None else ())
+        users = {
+            user.id: user
+            for user in with_sports(db.query(models.User)).filter(models.User.id.in_(ids.tolist()))
+        }
+        top = [(score, users[user_id]) for user_id, score in zip(ids.tolist(), scores.tolist()) if user_id in users]
+    elif top is None:
+        top = _stream_top_k(db, current_user, limit, seen)
+
+    return [
+        {
             "user": user,
             "compatibility_score": score,
-            "common_sports": common_sports
-        })
-    users_with_scores.sort(key=lambda x: x["compatibility_score"], reverse=True)
-    return users_with_scores[:limit]
+            "common_sports": get_common_sports(current_user, user)
+        }
+        for score, user in top
+    ]
+
+def _approximate_top_k(db: Session, current_user: models.User, limit: int, seen: Optional[SeenSet]) -> Optional[List[Tuple[float, models.User]]]:
+    """
+    Top-k entre los candidatos de LSH con el score exacto. Devuelve None si
+    LSH no encuentra suficientes candidatos (por ejemplo, usuario sin deportes).
+    """
+    candidates = sport_lsh.candidates(current_user, limit * LSH_CANDIDATES_FACTOR, exclude=seen)
+    if len(candidates) < limit:
+        return None
+    users = with_sports(db.query(models.User)).filter(
+        models.User.id.in_([user_id for user_id, _ in candidates])
+    )
+    scored = ((calculate_compatibility_score(current_user, user), user) for user in users)
+    return heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1].id))
+
+def _stream_top_k(db: Session, current_user: models.User, limit: int, seen: Optional[SeenSet]) -> List[Tuple[float, models.User]]:
+    """
+    Recorre la tabla por lotes y guarda solo los `limit` mejores en un heap:
+    memoria O(limit) y O(n log limit) comparaciones.
+    """
+    # Min-heap: la raíz es el peor de los guardados (menor score, mayor id)
+    heap: List[Tuple[float, int, models.User]] = []
+    users = (
+        with_sports(db.query(models.User))
+        .filter(models.User.id != current_user.id)
+        .yield_per(STREAM_BATCH_SIZE)
+    )
+    for user in users:
+        if seen is not None and user.id in seen:
+            continue
+        entry = (calculate_compatibility_score(current_user, user), -user.id, user)
+        if len(heap) < limit:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    return [(score, user) for score, _, user in sorted(heap, key=lambda e: e[:2], reverse=True)]
 
 def create_like(db: Session, liker_id: int, liked_id: int) -> models.Like:
     """
@@ -0,0 +1,379 @@
+"""
+Migraciones de esquema versionadas.
+
+Cada migración tiene un número y se aplica una sola vez, en orden y en su
+propia transacción; las aplicadas quedan en la tabla schema_migrations. Al
+iniciar, la app aplica las pendientes (MIGRATIONS_AUTO_APPLY=1, por defecto)
+o solo avisa cuáles faltan. También se pueden correr a mano:
+
+    python -m app.migrations status
+    python -m app.migrations upgrade
+
+Las migraciones son idempotentes (CREATE ... IF NOT EXISTS, columnas que se
+agregan solo si faltan): una base creada antes de este módulo, o con
+create_all, las marca como aplicadas sin cambios.
+
+Para agregar una: escribir la función que recibe la conexión y sumarla al
+final de MIGRATIONS con el número siguiente. Nunca renumerar ni editar una
+migración ya publicada. La migración 1 crea una copia fija del esquema
+(BASELINE), no el models.py actual: cada tabla, columna o índice nuevo lo
+crea solo la migración que lo agrega.
+"""
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, func,
+    inspect, select, text,
+)
+from sqlalchemy.schema import CreateIndex
+
+from . import models
+
+# Postgres: clave del advisory lock que serializa upgrade entre workers
+_UPGRADE_LOCK_KEY = 0x5350_4D49_4752
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# --- Utilidades para escribir migraciones ---
+
+def add_columns(conn, columns, metadata=None):
+    """Agrega las columnas (tabla, columna) de `metadata` (models.py) que falten"""
+    metadata = metadata if metadata is not None else models.Base.metadata
+    inspector = inspect(conn)
+    existing = {}
+    for table_name, column_name in columns:
+        if table_name not in existing:
+            existing[table_name] = {column["name"] for column in inspector.get_columns(table_name)}
+        if column_name in existing[table_name]:
+            continue
+        column = metadata.tables[table_name].columns[column_name]
+        definition = column.type.compile(dialect=conn.dialect)
+        if column.server_default is not None:
+            # Las filas existentes toman el default, así la columna puede ser NOT NULL
+            definition += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                definition += " NOT NULL"
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}"))
+        existing[table_name].add(column_name)
+        print(f"✅ Columna {table_name}.{column_name} agregada")
+
+
+def create_indexes(conn, names, metadata=None):
+    """Crea los índices de `metadata` (models.py) con esos nombres si no existen"""
+    metadata = metadata if metadata is not None else models.Base.metadata
+    indexes = {
+        index.name: index
+        for table in metadata.sorted_tables
+        for index in table.indexes
+    }
+    for name in names:
+        conn.execute(CreateIndex(indexes[name], if_not_exists=True))
+
+
+def has_index(conn, table_name, name):
+    return name in {index["name"] for index in inspect(conn).get_indexes(table_name)}
+
+
+# --- Esquema base ---
+
+# Copia fija de las tablas de models.py al crear este módulo, sin los índices
+# que agregan las migraciones 2 y 3. No se edita: los cambios van en
+# migraciones nuevas.
+BASELINE = MetaData()
+
+_users = Table(
+    "users", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String(50), unique=True, nullable=False),
+    Column("email", String(100), unique=True, nullable=False),
+    Column("password", String(255), nullable=False),
+    Column("deportes_preferidos", String(255)),
+    Column("descripcion", Text),
+    Column("foto_url", String(255)),
+    Column("video_url", String(255)),
+    Column("age", Integer, index=True),
+    Column("location", String(100)),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("profile_version", Integer, nullable=False, server_default="1"),
+    Column("instagram", String(100)),
+    Column("whatsapp", String(20)),
+    Column("phone", String(20)),
+)
+Index("ix_users_location_lower", func.lower(_users.c.location))
+Index("ix_users_lat_lon", _users.c.latitude, _users.c.longitude)
+
+Table(
+    "sports", BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(50), nullable=False),
+    Column("normalized", String(50), unique=True, nullable=False),
+)
+
+_user_sports = Table(
+    "user_sports", BASELINE,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("sport_id", Integer, ForeignKey("sports.id"), primary_key=True),
+    Column("level", String(30)),
+    Column("position", Integer, nullable=False),
+)
+Index("ix_user_sports_sport_id", _user_sports.c.sport_id, _user_sports.c.user_id)
+
+_likes = Table(
+    "likes", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("liked_user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime),
+)
+Index("uq_likes_user_liked", _likes.c.user_id, _likes.c.liked_user_id, unique=True)
+
+_dislikes = Table(
+    "dislikes", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("disliked_user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime),
+)
+Index("uq_dislikes_user_disliked", _dislikes.c.user_id, _dislikes.c.disliked_user_id, unique=True)
+
+_matches = Table(
+    "matches", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user1_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("user2_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime),
+)
+Index("uq_matches_users", _matches.c.user1_id, _matches.c.user2_id, unique=True)
+
+Table(
+    "messages", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("match_id", Integer, ForeignKey("matches.id"), nullable=False),
+    Column("sender_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime),
+    Column("is_read", Boolean),
+)
+
+
+# --- Migraciones ---
+
+_KEEP_FIRST_MATCH = "SELECT MIN(id) FROM matches GROUP BY user1_id, user2_id"
+
+# Índices únicos de likes, dislikes y matches: antes de crearlos hay que borrar duplicados
+_UNIQUE_DEDUPE = {
+    "uq_likes_user_liked": (
+        "likes",
+        ["DELETE FROM likes WHERE id NOT IN (SELECT MIN(id) FROM likes GROUP BY user_id, liked_user_id)"],
+    ),
+    "uq_dislikes_user_disliked": (
+        "dislikes",
+        ["DELETE FROM dislikes WHERE id NOT IN (SELECT MIN(id) FROM dislikes GROUP BY user_id, disliked_user_id)"],
+    ),
+    "uq_matches_users": (
+        "matches",
+        [
+            # Mismo orden para todos los pares: user1_id < user2_id
+            "UPDATE matches SET user1_id = user2_id, user2_id = user1_id WHERE user1_id > user2_id",
+            # Los mensajes de un match duplicado pasan al que se conserva
+            "UPDATE messages SET match_id = ("
+            " SELECT MIN(keep.id) FROM matches dup"
+            " JOIN matches keep ON keep.user1_id = dup.user1_id AND keep.user2_id = dup.user2_id"
+            " WHERE dup.id = messages.match_id"
+            f") WHERE match_id IN (SELECT id FROM matches WHERE id NOT IN ({_KEEP_FIRST_MATCH}))",
+            f"DELETE FROM matches WHERE id NOT IN ({_KEEP_FIRST_MATCH})",
+        ],
+    ),
+}
+
+
+def _baseline(conn):
+    """Tablas de BASELINE y las columnas e índices agregados después de crearlas"""
+    # Las tablas que ya existen no se tocan: sus índices únicos se crean abajo, sin duplicados
+    BASELINE.create_all(bind=conn)
+    add_columns(conn, (("users", "latitude"), ("users", "longitude"), ("users", "profile_version")), BASELINE)
+    for name, (table_name, dedupe) in _UNIQUE_DEDUPE.items():
+        if has_index(conn, table_name, name):
+            continue
+        for statement in dedupe:
+            conn.execute(text(statement))
+        create_indexes(conn, [name], BASELINE)
+    # Índices usados por /users/compatible
+    create_indexes(conn, ["ix_users_age", "ix_users_location_lower", "ix_users_lat_lon"], BASELINE)
+
+
+def _relationship_indexes(conn):
+    """
+    Likes recibidos, matches por cualquiera de los dos usuarios e historial de
+    un chat. likes(user_id, liked_user_id) y matches(user1_id) ya los cubren
+    los índices únicos de la migración 1.
+    """
+    create_indexes(conn, ["ix_likes_liked_user_id", "ix_matches_user2_id", "ix_messages_match_created"])
+
+
+def _unique_email_lower(conn):
+    """Un email por persona sin importar mayúsculas. Los duplicados se resuelven a mano"""
+    duplicates = conn.execute(text(
+        "SELECT lower(email) FROM users GROUP BY lower(email) HAVING COUNT(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        raise MigrationError(
+            f"Hay {len(duplicates)} emails repetidos con distintas mayúsculas "
+            f"(por ejemplo {', '.join(duplicates[:5])}): unificarlos antes de migrar"
+        )
+    create_indexes(conn, ["uq_users_email_lower"])
+
+
+def _inbox_summary(conn):
+    """Último mensaje, última actividad y no leídos por match para /inbox"""
+    add_columns(conn, [
+        ("matches", column) for column in ("last_message_id", "last_activity_at", "user1_unread", "user2_unread")
+    ])
+    conn.execute(text(
+        "UPDATE matches SET last_message_id = (SELECT MAX(id) FROM messages WHERE messages.match_id = matches.id)"
+    ))
+    conn.execute(text(
+        "UPDATE matches SET last_activity_at = COALESCE("
+        " (SELECT created_at FROM messages WHERE messages.id = matches.last_message_id),"
+        " created_at, CURRENT_TIMESTAMP)"
+    ))
+    for side in ("user1", "user2"):
+        conn.execute(text(
+            f"UPDATE matches SET {side}_unread = (SELECT COUNT(*) FROM messages"
+            " WHERE messages.match_id = matches.id"
+            f" AND messages.sender_id <> matches.{side}_id"
+            " AND (messages.is_read IS NULL OR messages.is_read = FALSE))"
+        ))
+    create_indexes(conn, ["ix_matches_user1_activity", "ix_matches_user2_activity"])
+
+
+def _history_cursor_index(conn):
+    """Páginas del historial por id de mensaje"""
+    create_indexes(conn, ["ix_messages_match_id"])
+
+
+def _read_watermarks(conn):
+    """
+    Marca de lectura por participante en vez de is_read por mensaje. Queda
+    justo antes del primer mensaje no leído del otro, y los contadores de no
+    leídos se recalculan con esa marca.
+    """
+    add_columns(conn, [("matches", "user1_last_read_id"), ("matches", "user2_last_read_id")])
+    for side in ("user1", "user2"):
+        conn.execute(text(
+            f"UPDATE matches SET {side}_last_read_id = COALESCE("
+            " (SELECT MIN(id) - 1 FROM messages"
+            "  WHERE messages.match_id = matches.id"
+            f"  AND messages.sender_id <> matches.{side}_id"
+            "  AND (messages.is_read IS NULL OR messages.is_read = FALSE)),"
+            " last_message_id, 0)"
+        ))
+        conn.execute(text(
+            f"UPDATE matches SET {side}_unread = (SELECT COUNT(*) FROM messages"
+            " WHERE messages.match_id = matches.id"
+            f" AND messages.sender_id <> matches.{side}_id"
+            f" AND messages.id > matches.{side}_last_read_id)"
+        ))
+
+
+def _message_archive(conn):
+    """Tabla de mensajes archivados y hasta dónde está archivado cada match"""
+    models.MessageArchive.__table__.create(conn, checkfirst=True)
+    add_columns(conn, [("matches", "archived_through_id")])
+    create_indexes(conn, ["ix_message_archive_match_last"])
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "esquema_base", _baseline),
+    Migration(2, "indices_likes_matches_messages", _relationship_indexes),
+    Migration(3, "email_unico_sin_mayusculas", _unique_email_lower),
+    Migration(4, "resumen_de_chats", _inbox_summary),
+    Migration(5, "indice_historial_por_id", _history_cursor_index),
+    Migration(6, "marcas_de_lectura", _read_watermarks),
+    Migration(7, "archivo_de_mensajes", _message_archive),
+]
+
+
+# --- Ejecución ---
+
+def applied_versions(engine) -> List[int]:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return sorted(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine) -> List[Migration]:
+    applied = set(applied_versions(engine))
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def upgrade(engine) -> List[Migration]:
+    """
+    Aplica las migraciones pendientes en orden y devuelve las aplicadas.
+    Se detiene en la primera que falla (queda sin marcar) y la relanza.
+    """
+    applied: List[Migration] = []
+    with engine.connect() as lock_conn:
+        # Con varios workers iniciando a la vez, uno migra y los demás esperan
+        if engine.dialect.name == "postgresql":
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _UPGRADE_LOCK_KEY})
+        try:
+            for migration in pending(engine):
+                print(f"🔄 Aplicando migración {migration.version}: {migration.name}")
+                with engine.begin() as conn:
+                    migration.apply(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+                    ))
+                applied.append(migration)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _UPGRADE_LOCK_KEY})
+    return applied
+
+
+def main(argv: List[str]) -> int:
+    from .database import engine
+
+    command = argv[0] if argv else "status"
+    if command == "upgrade":
+        try:
+            applied = upgrade(engine)
+        except Exception as e:
+            print(f"❌ Error aplicando migraciones: {e}")
+            return 1
+        print(f"✅ {len(applied)} migraciones aplicadas" if applied else "✅ El esquema ya está al día")
+        return 0
+    if command == "status":
+        applied = set(applied_versions(engine))
+        for migration in MIGRATIONS:
+            mark = "✅" if migration.version in applied else "⏳"
+            print(f"{mark} {migration.version:>3} {migration.name}")
+        return 0
+    print("Uso: python -m app.migrations [status|upgrade]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Boolean, Index, LargeBinary, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import NamedTuple, Optional
 
 Base = declarative_base()
 
@@ -16,12 +17,69 @@ class User(Base):
     descripcion = Column(Text)
     foto_url = Column(String(255))
     video_url = Column(String(255))
-    age = Column(Integer)
+    age = Column(Integer, index=True)
     location = Column(String(100))
+    # Coordenadas para la búsqueda por radio (ver app/geo.py)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Se incrementa en cada cambio de perfil (ver app/profile_cards.py)
+    profile_version = Column(Integer, nullable=False, default=1, server_default="1")
     instagram = Column(String(100))
     whatsapp = Column(String(20))
     phone = Column(String(20))
 
+    # Deportes ya parseados de deportes_preferidos (ver app/sports.py)
+    user_sports = relationship(
+        "UserSport", order_by="UserSport.position", cascade="all, delete-orphan"
+    )
+
+    __table_args__ = (
+        # Filtro de ubicación sin distinguir mayúsculas en /users/compatible
+        Index("ix_users_location_lower", func.lower(location)),
+        # Prefiltro por caja de la búsqueda por radio
+        Index("ix_users_lat_lon", latitude, longitude),
+        # Un email por persona sin importar mayúsculas (login y registro buscan por lower(email))
+        Index("uq_users_email_lower", func.lower(email), unique=True),
+    )
+
+    @property
+    def sport_levels(self):
+        """Deportes del usuario como tuplas (nombre, nivel)"""
+        return tuple(SportLevel(entry.sport.name, entry.level) for entry in self.user_sports)
+
+class SportLevel(NamedTuple):
+    name: str
+    level: Optional[str]
+
+    @property
+    def key(self):
+        """Identidad usada para comparar deportes entre usuarios"""
+        return (self.name.lower(), (self.level or "").lower())
+
+class Sport(Base):
+    __tablename__ = "sports"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), nullable=False)
+    # Nombre en minúsculas, único: "Fútbol" y "fútbol" son el mismo deporte
+    normalized = Column(String(50), unique=True, nullable=False)
+
+class UserSport(Base):
+    __tablename__ = "user_sports"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    sport_id = Column(Integer, ForeignKey("sports.id"), primary_key=True)
+    level = Column(String(30))
+    position = Column(Integer, nullable=False, default=0)
+
+    # Relaciones
+    sport = relationship("Sport", lazy="joined")
+
+    __table_args__ = (
+        # Filtro por deporte en /users/compatible
+        Index("ix_user_sports_sport_id", sport_id, user_id),
+    )
+
 class Like(Base):
     __tablename__ = "likes"
     
@@ -34,6 +92,29 @@ class Like(Base):
     user = relationship("User", foreign_keys=[user_id])
     liked_user = relationship("User", foreign_keys=[liked_user_id])
 
+    __table_args__ = (
+        # Un like por par: los inserts usan ON CONFLICT DO NOTHING (ver app/swipes.py)
+        Index("uq_likes_user_liked", user_id, liked_user_id, unique=True),
+        # Likes recibidos por un usuario
+        Index("ix_likes_liked_user_id", liked_user_id),
+    )
+
+class Dislike(Base):
+    __tablename__ = "dislikes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    disliked_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relaciones
+    user = relationship("User", foreign_keys=[user_id])
+    disliked_user = relationship("User", foreign_keys=[disliked_user_id])
+
+    __table_args__ = (
+        Index("uq_dislikes_user_disliked", user_id, disliked_user_id, unique=True),
+    )
+
 class Match(Base):
     __tablename__ = "matches"
     
@@ -41,11 +122,33 @@ class Match(Base):
     user1_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     user2_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Resumen para /inbox, se actualiza con cada mensaje (ver app/chat.py).
+    # last_message_id sin ForeignKey para no crear un ciclo matches <-> messages
+    last_message_id = Column(Integer)
+    last_activity_at = Column(DateTime, default=datetime.utcnow)
+    # Mensajes sin leer de cada participante
+    user1_unread = Column(Integer, nullable=False, default=0, server_default="0")
+    user2_unread = Column(Integer, nullable=False, default=0, server_default="0")
+    # Hasta qué mensaje leyó cada participante (POST /messages/{match_id}/read)
+    user1_last_read_id = Column(Integer, nullable=False, default=0, server_default="0")
+    user2_last_read_id = Column(Integer, nullable=False, default=0, server_default="0")
+    # Los mensajes con id <= archived_through_id están en message_archive (ver app/archive.py)
+    archived_through_id = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relaciones
     user1 = relationship("User", foreign_keys=[user1_id])
     user2 = relationship("User", foreign_keys=[user2_id])
 
+    __table_args__ = (
+        # Un match por par, guardado con user1_id < user2_id
+        Index("uq_matches_users", user1_id, user2_id, unique=True),
+        # uq_matches_users ya sirve para buscar por user1_id
+        Index("ix_matches_user2_id", user2_id),
+        # Chats de un usuario por última actividad, uno por cada lado del par
+        Index("ix_matches_user1_activity", user1_id, last_activity_at, id),
+        Index("ix_matches_user2_activity", user2_id, last_activity_at, id),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
     
@@ -54,10 +157,37 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Ya no se actualiza: la lectura sale de las marcas de Match (ver app/chat.py)
     is_read = Column(Boolean, default=False)
     
     # Relaciones
     match = relationship("Match")
     sender = relationship("User", foreign_keys=[sender_id])
 
+    __table_args__ = (
+        # Historial de un chat en orden
+        Index("ix_messages_match_created", match_id, created_at),
+        # Cursores before_id / after_id del historial (ver app/chat.py)
+        Index("ix_messages_match_id", match_id, id),
+    )
+
+class MessageArchive(Base):
+    """Mensajes viejos de un match, comprimidos en bloques (ver app/archive.py)"""
+    __tablename__ = "message_archive"
+
+    id = Column(Integer, primary_key=True)
+    match_id = Column(Integer, ForeignKey("matches.id"), nullable=False)
+    # Rango de ids de mensaje del bloque; los bloques de un match no se solapan
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    # Líneas JSON [id, sender_id, content, created_at] comprimidas con zlib
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Bloques de un match en orden, para leer hacia atrás o hacia adelante desde un id
+        Index("ix_message_archive_match_last", match_id, last_message_id),
+    )
+
 # Las tablas Like y Match pueden quedarse si existen en Railway, si no, comentarlas o eliminarlas temporalmente.
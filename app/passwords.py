@@ -0,0 +1,164 @@
+"""
+Hash y verificación de contraseñas (bcrypt) fuera del event loop.
+
+Un bcrypt con costo 12 son ~250 ms de CPU. Se corre en un pool de procesos
+(PASSWORD_WORKERS, por defecto uno por núcleo) para no trabar el event loop
+ni el threadpool y usar todos los núcleos.
+
+- Admisión: con PASSWORD_MAX_PENDING operaciones en curso o en cola, las
+  nuevas se rechazan con Overloaded y el endpoint responde 429. Es mejor que
+  encolar logins para siempre.
+- El costo sale de BCRYPT_ROUNDS. Si cambia, las contraseñas con otro costo
+  se vuelven a hashear en el próximo login correcto (verify devuelve el hash
+  nuevo y el endpoint lo guarda).
+- Con PASSWORD_WORKERS=0 todo corre en el thread que llama (tests, entornos
+  sin multiprocessing).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(max(WORKERS, 1) * 8)))
+# Últimas latencias guardadas por operación para los percentiles de /metrics
+LATENCY_SAMPLES = 1000
+
+# min = max = default: un hash con otro costo queda marcado para actualizar
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class Overloaded(Exception):
+    """Demasiadas operaciones de contraseña en curso"""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    # Un hash que no es bcrypt (datos viejos) cuenta como contraseña incorrecta
+    try:
+        return pwd_context.verify_and_update(password, hashed)
+    except ValueError:
+        return False, None
+
+
+class PasswordPool:
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # operación -> contadores y últimas latencias en ms (cola + cálculo)
+        self._counts: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+        self._latencies: Dict[str, deque] = {}
+        self.rehashed = 0
+
+    def hash(self, password: str) -> str:
+        return self._submit("hash", _hash, password).result()
+
+    def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(correcta, hash nuevo si hay que guardarlo por cambio de costo)"""
+        ok, new_hash = self._submit("verify", _verify, password, hashed).result()
+        if new_hash:
+            self._count_rehash()
+        return ok, new_hash
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit("hash", _hash, password))
+
+    async def verify_async(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        ok, new_hash = await asyncio.wrap_future(self._submit("verify", _verify, password, hashed))
+        if new_hash:
+            self._count_rehash()
+        return ok, new_hash
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hashes en paralelo en todos los workers, sin límite de admisión (carga de datos)"""
+        futures = [self._submit("hash", _hash, password, admit=False) for password in passwords]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {}
+            for op in set(self._counts) | set(self._rejected):
+                samples = sorted(self._latencies.get(op, ()))
+                operations[op] = {
+                    "count": self._counts.get(op, 0),
+                    "rejected": self._rejected.get(op, 0),
+                    "p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+                    "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 1) if samples else None,
+                }
+            return {
+                "workers": self.workers,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "rehashed": self.rehashed,
+                "operations": operations,
+            }
+
+    def _submit(self, op: str, fn, *args, admit: bool = True) -> Future:
+        with self._lock:
+            if admit and self._pending >= self.max_pending:
+                self._rejected[op] = self._rejected.get(op, 0) + 1
+                raise Overloaded(op)
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                future: Future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._done(op, started)
+            raise
+        future.add_done_callback(lambda _: self._done(op, started))
+        return future
+
+    def _done(self, op: str, started: float) -> None:
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._pending -= 1
+            self._counts[op] = self._counts.get(op, 0) + 1
+            self._latencies.setdefault(op, deque(maxlen=LATENCY_SAMPLES)).append(elapsed)
+
+    def _count_rehash(self) -> None:
+        with self._lock:
+            self.rehashed += 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: los workers no heredan conexiones a la base ni locks del proceso principal
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+
+password_pool = PasswordPool()
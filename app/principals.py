@@ -0,0 +1,119 @@
+"""
+Cache del usuario autenticado ("principal") por token.
+
+Cada request autenticado decodifica el JWT y buscaba al usuario en la base.
+La mayoría de los endpoints solo usan el id, así que acá se guarda, por
+(sub, exp) del token, un Principal inmutable con id, email, username y
+profile_version. get_current_principal (app/auth.py) lo devuelve sin ir a la
+base; los endpoints que modifican al usuario siguen cargando la fila.
+
+- Las entradas viven PRINCIPAL_CACHE_TTL segundos (y nunca más que el token).
+- profile_events.profile_changed / profile_removed invalidan las entradas
+  del usuario (también si cambió el email: el token viejo vuelve a buscarse
+  y ya no lo encuentra).
+- Con varios workers la invalidación es local al proceso: en los demás un
+  principal puede quedar viejo hasta el TTL. Por eso lo que depende del
+  perfil completo o de profile_version exacta (GET /users/me) usa la fila.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+
+MAX_PRINCIPALS = 10000
+TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+
+class Principal(NamedTuple):
+    id: int
+    email: str
+    username: str
+    profile_version: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.id, user.email, user.username, user.profile_version or 0)
+
+
+class PrincipalCache:
+    def __init__(self, max_size: int = MAX_PRINCIPALS, ttl: float = TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (sub, exp) -> (vence, principal), del menos al más usado
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[float, Principal]]" = OrderedDict()
+        # user_id -> claves de sus tokens, para invalidar
+        self._keys: Dict[int, Set[Tuple[str, Any]]] = {}
+        # Cuenta invalidaciones: si hubo una durante la carga, no se guarda lo cargado
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, sub: str, exp) -> Tuple[Optional[Principal], int]:
+        """(principal o None, generación a pasarle a `put` si hubo que cargarlo)"""
+        key = (sub, exp)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1], self._generation
+            if cached is not None:
+                self._remove(key)
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, sub: str, exp, principal: Principal, generation: int) -> None:
+        key = (sub, exp)
+        expires = time.monotonic() + self.ttl
+        if isinstance(exp, (int, float)):
+            # Nunca más allá del vencimiento del token
+            expires = min(expires, time.monotonic() + exp - time.time())
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (expires, principal)
+            self._keys.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in list(self._keys.get(user_id, ())):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _remove(self, key: Tuple[str, Any]) -> None:
+        """Con self._lock tomado"""
+        cached = self._entries.pop(key, None)
+        if cached is None:
+            return
+        keys = self._keys.get(cached[1].id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[cached[1].id]
+
+
+principal_cache = PrincipalCache()
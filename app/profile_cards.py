@@ -0,0 +1,147 @@
+"""
+Cache de "tarjetas" de perfil ya serializadas.
+
+Los endpoints que devuelven a otros usuarios (/users/compatible, /users/feed,
+/matches, /matches/{user_id}, /messages/{match_id}) arman siempre el mismo
+dict a partir de la fila: valores por defecto, deportes, URLs de respaldo.
+Acá se arma una vez por (usuario, vista) y se reutiliza mientras no cambie
+User.profile_version, que incrementan los endpoints que editan el perfil.
+
+La versión viene de la fila leída de la base, así que con varios workers
+cada proceso detecta solo los cambios hechos en los demás.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from . import models
+from .sport_index import DEFAULT_AGE
+from .sports import sports_payload
+
+MAX_CARDS = 20000
+
+DEFAULT_LOCATION = "Buenos Aires"
+DEFAULT_BIO = "Amante del deporte"
+DEFAULT_PHOTO = "https://images.unsplash.com/photo-1535713875002-d1d0cf377fde?w=150&h=150&fit=crop&crop=face"
+
+
+def bump_version(user: models.User) -> None:
+    """Incrementa profile_version en el mismo UPDATE del cambio de perfil"""
+    user.profile_version = models.User.profile_version + 1
+
+
+def _discovery_card(user) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "name": user.username,
+        "age": user.age or DEFAULT_AGE,
+        "location": user.location or DEFAULT_LOCATION,
+        "bio": user.descripcion or DEFAULT_BIO,
+        "foto_url": user.foto_url or DEFAULT_PHOTO,
+        "video_url": user.video_url or "",
+        "sports": sports_payload(user),  # Array de objetos
+    }
+
+
+def _match_card(user) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "name": user.username,
+        "age": user.age or DEFAULT_AGE,
+        "location": user.location or DEFAULT_LOCATION,
+        "bio": user.descripcion or DEFAULT_BIO,
+        "foto_url": user.foto_url or "",
+        "video_url": user.video_url or "",
+        "sports": sports_payload(user),
+    }
+
+
+def _detail_card(user) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "age": user.age,
+        "location": user.location,
+        "descripcion": user.descripcion,
+        "foto_url": user.foto_url,
+        "video_url": user.video_url,
+        "deportes_preferidos": user.deportes_preferidos,
+        "sports": sports_payload(user),
+        "instagram": user.instagram,
+        "whatsapp": user.whatsapp,
+        "phone": user.phone,
+    }
+
+
+def _sender_card(user) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "foto_url": user.foto_url,
+    }
+
+
+VIEWS: Dict[str, Callable[[Any], Dict[str, Any]]] = {
+    "discovery": _discovery_card,
+    "match": _match_card,
+    "detail": _detail_card,
+    "sender": _sender_card,
+}
+
+
+class ProfileCardCache:
+    def __init__(self, max_cards: int = MAX_CARDS):
+        self.max_cards = max_cards
+        self._lock = threading.Lock()
+        # (user_id, vista) -> (profile_version, tarjeta)
+        self._cards: "OrderedDict[Tuple[int, str], Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def card(self, user, view: str) -> Dict[str, Any]:
+        """
+        Tarjeta de `user` para la vista `view`. Es compartida: quien necesite
+        agregar campos tiene que copiarla ({**card, ...}).
+        """
+        key = (user.id, view)
+        version = user.profile_version or 0
+        with self._lock:
+            cached = self._cards.get(key)
+            if cached is not None and cached[0] == version:
+                self._cards.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        card = VIEWS[view](user)
+        with self._lock:
+            cached = self._cards.get(key)
+            # Otro request pudo haber guardado una versión más nueva
+            if cached is None or cached[0] <= version:
+                self._cards[key] = (version, card)
+                self._cards.move_to_end(key)
+            while len(self._cards) > self.max_cards:
+                self._cards.popitem(last=False)
+                self.evictions += 1
+        return card
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            for view in VIEWS:
+                self._cards.pop((user_id, view), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cards),
+                "max_size": self.max_cards,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+profile_cards = ProfileCardCache()
@@ -0,0 +1,37 @@
+"""
+Punto único para avisar que un perfil cambió.
+
+Los endpoints que crean, editan o borran usuarios llaman a estas funciones y
+acá se actualizan todas las estructuras en memoria derivadas de los perfiles.
+"""
+from .feed import feed_store
+from .geo import geo_index
+from .lsh import sport_lsh
+from .principals import principal_cache
+from .profile_cards import profile_cards
+from .scoring import profile_matrix
+from .sport_index import profile_index
+
+
+def profile_changed(user, fields=None) -> None:
+    """
+    Llamar después del commit que crea o edita el perfil. `fields` son los
+    campos modificados (None si no se sabe, por ejemplo al registrarse).
+    """
+    profile_index.upsert(user)
+    profile_matrix.upsert(user)
+    geo_index.upsert(user)
+    sport_lsh.upsert(user)
+    profile_cards.invalidate(user.id)
+    principal_cache.invalidate(user.id)
+    feed_store.profile_changed(user, fields)
+
+
+def profile_removed(user_id: int) -> None:
+    profile_index.remove(user_id)
+    profile_matrix.remove(user_id)
+    geo_index.remove(user_id)
+    sport_lsh.remove(user_id)
+    profile_cards.invalidate(user_id)
+    principal_cache.invalidate(user_id)
+    feed_store.profile_removed(user_id)
@@ -0,0 +1,233 @@
+"""
+Eventos en tiempo real (mensajes, lecturas y matches nuevos) para /ws/chat
+y /events (Server-Sent Events).
+
+- Los endpoints publican con `hub.publish(canal, evento)` desde cualquier
+  thread (los endpoints sync corren en el threadpool de FastAPI).
+- Canales: "match:<id>" para los mensajes y lecturas de un chat y
+  "user:<id>" para los matches nuevos de un usuario.
+- Cada conexión es una Subscription con su cola asyncio. Cuando llega un
+  match nuevo por "user:<id>" la suscripción se agrega sola al canal del
+  match, así ya recibe sus mensajes.
+- Cada evento entregado recibe un id "<arranque>-<secuencia>" y queda en un
+  buffer circular (RECENT_EVENTS) para que /events pueda retomar desde
+  Last-Event-ID. Si el id es de otro arranque o ya salió del buffer, el
+  cliente tiene que volver a pedir sus datos.
+- El transporte entre publicadores y el hub es un Broker. InMemoryBroker
+  solo entrega dentro del proceso: con varios workers hay que configurar en
+  REALTIME_BROKER ("modulo:Clase") un broker compartido, por ejemplo sobre
+  Redis pub/sub, que implemente la misma interfaz.
+"""
+import asyncio
+import importlib
+import threading
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Eventos en cola por conexión: un cliente que no lee se desconecta
+QUEUE_SIZE = 256
+# Últimos eventos guardados para retomar /events con Last-Event-ID
+RECENT_EVENTS = 10000
+
+
+def match_channel(match_id: int) -> str:
+    return f"match:{match_id}"
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class Broker:
+    """
+    Transporte de eventos. `publish` se llama desde cualquier thread; el
+    broker tiene que terminar llamando `deliver(canal, evento)` en el event
+    loop recibido en `start`, en este proceso y en los demás.
+    """
+
+    def start(self, loop: asyncio.AbstractEventLoop, deliver: Callable[[str, Dict[str, Any]], None]) -> None:
+        raise NotImplementedError
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        pass
+
+
+class InMemoryBroker(Broker):
+    """Entrega solo dentro del proceso (un worker, o tests)"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._deliver = None
+
+    def start(self, loop, deliver) -> None:
+        self._loop, self._deliver = loop, deliver
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._deliver, channel, event)
+
+
+def load_broker(spec: Optional[str]) -> Broker:
+    """Broker de "paquete.modulo:Clase"; sin spec, InMemoryBroker"""
+    if not spec:
+        return InMemoryBroker()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class Subscription:
+    def __init__(self, user_id: int, channels: Iterable[str]):
+        self.user_id = user_id
+        self.channels: Set[str] = set(channels)
+        self.queue: "asyncio.Queue[Optional[Tuple[Optional[str], Dict[str, Any]]]]" = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+    async def next_event(self) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        """Próximo (id, evento); None si la suscripción se cortó por no leer a tiempo"""
+        return await self.queue.get()
+
+    def offer(self, event: Dict[str, Any], event_id: Optional[str] = None) -> bool:
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait((event_id, event))
+            return True
+        except asyncio.QueueFull:
+            # Se vacía la cola y se deja solo la marca de corte
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+
+class Hub:
+    """Suscripciones por canal. Todo menos `publish` corre en el event loop"""
+
+    def __init__(self):
+        self.broker: Broker = InMemoryBroker()
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.connections = 0
+        # Identifica este arranque: los ids de eventos de otro proceso no se pueden retomar
+        self.boot = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._recent: "deque[Tuple[int, str, Dict[str, Any]]]" = deque(maxlen=RECENT_EVENTS)
+
+    def start(self, loop: asyncio.AbstractEventLoop, broker: Optional[Broker] = None) -> None:
+        if broker is not None:
+            self.broker = broker
+        self.broker.start(loop, self._deliver)
+
+    def stop(self) -> None:
+        self.broker.stop()
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self.published += 1
+        self.broker.publish(channel, event)
+
+    def subscribe(self, user_id: int, channels: Iterable[str]) -> Subscription:
+        subscription = Subscription(user_id, channels)
+        for channel in subscription.channels:
+            self._channels.setdefault(channel, set()).add(subscription)
+        self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.closed:
+            return
+        subscription.closed = True
+        for channel in subscription.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+        self.connections -= 1
+
+    def add_channel(self, subscription: Subscription, channel: str) -> None:
+        subscription.channels.add(channel)
+        self._channels.setdefault(channel, set()).add(subscription)
+
+    def replay(self, channels: Set[str], last_event_id: str) -> Tuple[List[Tuple[str, Dict[str, Any]]], bool]:
+        """
+        Eventos de `channels` posteriores a `last_event_id`, y si están
+        todos (False: el id es de otro arranque o ya salió del buffer).
+        """
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return [], False
+        after = int(seq)
+        oldest = self._recent[0][0] if self._recent else self._seq + 1
+        events = [
+            (self._event_id(event_seq), event)
+            for event_seq, channel, event in self._recent
+            if event_seq > after and channel in channels
+        ]
+        return events, after >= oldest - 1 and after <= self._seq
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broker": type(self.broker).__name__,
+            "connections": self.connections,
+            "channels": len(self._channels),
+            "buffered_events": len(self._recent),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def _deliver(self, channel: str, event: Dict[str, Any]) -> None:
+        self._seq += 1
+        self._recent.append((self._seq, channel, event))
+        event_id = self._event_id(self._seq)
+        for subscription in list(self._channels.get(channel, ())):
+            if event.get("type") == "match" and channel == user_channel(subscription.user_id):
+                self.add_channel(subscription, match_channel(event["match_id"]))
+            if subscription.offer(event, event_id):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+
+hub = Hub()
+
+
+def message_payload(message) -> Dict[str, Any]:
+    return {
+        "id": message.id,
+        "content": message.content,
+        "sender_id": message.sender_id,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def publish_message(match_id: int, payload: Dict[str, Any]) -> None:
+    """Mensaje nuevo (ya confirmado en la base) a los conectados al chat"""
+    hub.publish(match_channel(match_id), {"type": "message", "match_id": match_id, "message": payload})
+
+
+def publish_read(match_id: int, user_id: int, last_read_id: int) -> None:
+    """Confirmación de lectura para el otro participante"""
+    hub.publish(match_channel(match_id), {
+        "type": "read", "match_id": match_id, "user_id": user_id, "last_read_id": last_read_id,
+    })
+
+
+def publish_match(match_id: int, user_a: int, user_b: int) -> None:
+    """Avisa a los dos usuarios del match nuevo"""
+    for user_id, other_id in ((user_a, user_b), (user_b, user_a)):
+        hub.publish(user_channel(user_id), {"type": "match", "match_id": match_id, "user_id": other_id})
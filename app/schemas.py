@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Literal
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -11,6 +11,8 @@ class UserBase(BaseModel):
     video_url: Optional[str] = None
     age: Optional[int] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     name: Optional[str] = None
     bio: Optional[str] = None
     sports: Optional[str] = None
@@ -28,6 +30,8 @@ class UserCreate(BaseModel):
     video_url: Optional[str] = None
     age: Optional[int] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     name: Optional[str] = None
     bio: Optional[str] = None
     sports: Optional[str] = None
@@ -48,6 +52,8 @@ class UserUpdate(BaseModel):
     video_url: Optional[str] = None
     age: Optional[int] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     profilePicture: Optional[str] = None
     name: Optional[str] = None
     bio: Optional[str] = None
@@ -80,6 +86,18 @@ class UserCompatible(User):
     compatibility_score: Optional[float] = None
     common_sports: Optional[List[str]] = None
 
+class SwipeAction(BaseModel):
+    user_id: int
+    action: Literal["like", "dislike"]
+
+class SwipeBatch(BaseModel):
+    # Acciones en el orden en que se hicieron
+    swipes: List[SwipeAction] = Field(..., min_length=1, max_length=100)
+
+class MessagesRead(BaseModel):
+    # Último mensaje leído; sin valor, hasta el último del chat
+    last_read_id: Optional[int] = Field(None, ge=0)
+
 class LikeCreate(BaseModel):
     liked_user_id: int
 
@@ -0,0 +1,221 @@
+"""
+Scoring de compatibilidad por lotes con NumPy.
+
+ProfileMatrix guarda un snapshot columnar de todos los perfiles:
+- deportes como bitmask sobre un vocabulario de deportes internado
+- edades como un array de enteros (0 = sin edad)
+- ubicaciones como códigos internados (0 = sin ubicación)
+- coordenadas como arrays de floats (NaN = sin coordenadas)
+
+Con eso el score de un usuario contra toda la población se calcula con unas
+pocas operaciones sobre arrays y da exactamente el mismo resultado que
+matching.calculate_compatibility_score.
+"""
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM, PROXIMITY_POINTS, has_coordinates
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Cantidad de bits en 1 por fila de una matriz uint64"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    as_bytes = np.ascontiguousarray(words).view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int64)
+
+
+def _haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Misma fórmula que geo.haversine_km contra un array de puntos"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def sport_tokens(user) -> frozenset:
+    """Mismo criterio que calculate_compatibility_score para comparar deportes"""
+    return frozenset(sport.key for sport in user.sport_levels)
+
+
+class ProfileMatrix:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._vocab: Dict[str, int] = {}
+        self._location_codes: Dict[str, int] = {}
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+        self._allocate(capacity, 1)
+        self.ready = False
+
+    def build(self, users) -> None:
+        """Reconstruye el snapshot a partir de un iterable de usuarios"""
+        with self._lock:
+            self._vocab = {}
+            self._location_codes = {}
+            self._rows = {}
+            self._size = 0
+            self._allocate(1024, 1)
+            for user in users:
+                self._upsert_locked(user)
+            self.ready = True
+
+    def upsert(self, user) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._upsert_locked(user)
+
+    def remove(self, user_id: int) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is not None:
+                self.active[row] = False
+
+    def score_all(self, user, exclude: Sequence[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve (ids, scores) de todos los perfiles activos distintos de `user`
+        y de los ids de `exclude`.
+        """
+        with self._lock:
+            n = self._size
+            mask = self.active[:n].copy()
+            row = self._rows.get(user.id)
+            if row is not None:
+                mask[row] = False
+            if len(exclude):
+                mask &= ~np.isin(self.ids[:n], np.asarray(exclude, dtype=np.int64))
+
+            query_sports, query_count = self._encode_sports(sport_tokens(user), intern=False)
+            query_location = self._location_code(user.location, intern=False)
+            query_age = user.age or 0
+            ids = self.ids[:n]
+
+            # 1. Deportes en común (40 puntos)
+            if query_count:
+                counts = self.sport_counts[:n]
+                common = _popcount(np.bitwise_and(self.sports[:n], query_sports))
+                has_sports = counts > 0
+                denominator = np.where(has_sports, np.maximum(counts, query_count), 1)
+                scores = np.where(has_sports, 40 * (common / denominator), 0.0)
+            else:
+                scores = np.zeros(n, dtype=np.float64)
+
+            # 2. Ubicación (30 puntos)
+            if query_location:
+                scores = scores + np.where(self.locations[:n] == query_location, 30, 0)
+
+            # 3. Rango de edad (20 puntos)
+            if query_age:
+                ages = self.ages[:n]
+                age_diff = np.abs(ages - query_age)
+                age_points = np.select(
+                    [age_diff <= 5, age_diff <= 10, age_diff <= 15], [20, 15, 10], default=0
+                )
+                scores = scores + np.where(ages != 0, age_points, 0)
+
+            # 4. Cercanía (10 puntos); NaN no cumple ninguna condición
+            if has_coordinates(user):
+                distances = _haversine_km(user.latitude, user.longitude, self.latitudes[:n], self.longitudes[:n])
+                scores = scores + np.select(
+                    [distances <= max_km for max_km, _ in PROXIMITY_POINTS],
+                    [points for _, points in PROXIMITY_POINTS],
+                    default=0,
+                )
+
+            return ids[mask], np.minimum(scores, 100.0)[mask]
+
+    def top(self, user, limit: int, exclude: Sequence[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """Los `limit` perfiles con mayor score (desempate por id ascendente)"""
+        ids, scores = self.score_all(user, exclude)
+        if limit < len(ids):
+            # Umbral del k-ésimo mejor score; los empates en el umbral se resuelven por id
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = scores >= threshold
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[:limit]
+        return ids[order], scores[order]
+
+    def _allocate(self, capacity: int, words: int) -> None:
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.sports = np.zeros((capacity, words), dtype=np.uint64)
+        self.sport_counts = np.zeros(capacity, dtype=np.int64)
+        self.ages = np.zeros(capacity, dtype=np.int64)
+        self.locations = np.zeros(capacity, dtype=np.int64)
+        self.latitudes = np.full(capacity, np.nan)
+        self.longitudes = np.full(capacity, np.nan)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, capacity: int, words: int) -> None:
+        old = (
+            self.ids, self.sports, self.sport_counts, self.ages, self.locations,
+            self.latitudes, self.longitudes, self.active,
+        )
+        n = self._size
+        self._allocate(capacity, words)
+        self.ids[:n] = old[0][:n]
+        self.sports[:n, :old[1].shape[1]] = old[1][:n]
+        self.sport_counts[:n] = old[2][:n]
+        self.ages[:n] = old[3][:n]
+        self.locations[:n] = old[4][:n]
+        self.latitudes[:n] = old[5][:n]
+        self.longitudes[:n] = old[6][:n]
+        self.active[:n] = old[7][:n]
+
+    def _upsert_locked(self, user) -> None:
+        sports, count = self._encode_sports(sport_tokens(user), intern=True)
+        row = self._rows.get(user.id)
+        if row is None:
+            if self._size == len(self.ids):
+                self._grow(2 * len(self.ids), self.sports.shape[1])
+            row = self._size
+            self._size += 1
+            self._rows[user.id] = row
+        self.ids[row] = user.id
+        self.sports[row] = sports
+        self.sport_counts[row] = count
+        self.ages[row] = user.age or 0
+        self.locations[row] = self._location_code(user.location, intern=True)
+        if has_coordinates(user):
+            self.latitudes[row], self.longitudes[row] = user.latitude, user.longitude
+        else:
+            self.latitudes[row] = self.longitudes[row] = np.nan
+        self.active[row] = True
+
+    def _encode_sports(self, tokens: frozenset, intern: bool) -> Tuple[np.ndarray, int]:
+        if intern:
+            for token in tokens:
+                if token not in self._vocab:
+                    self._vocab[token] = len(self._vocab)
+            words = (len(self._vocab) + 63) // 64
+            if words > self.sports.shape[1]:
+                self._grow(len(self.ids), words)
+        encoded = np.zeros(self.sports.shape[1], dtype=np.uint64)
+        for token in tokens:
+            bit = self._vocab.get(token)
+            if bit is not None:
+                encoded[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        # Los deportes que nadie más practica no suman en común pero sí cuentan para el máximo
+        return encoded, len(tokens)
+
+    def _location_code(self, location: Optional[str], intern: bool) -> int:
+        if not location:
+            return 0
+        key = location.lower()
+        code = self._location_codes.get(key)
+        if code is None:
+            if not intern:
+                return -1
+            code = len(self._location_codes) + 1
+            self._location_codes[key] = code
+        return code
+
+
+# Snapshot compartido, se construye la primera vez que se usa
+profile_matrix = ProfileMatrix()
@@ -0,0 +1,76 @@
+"""
+Usuarios que cada usuario ya vio en descubrimiento (likes y dislikes).
+
+Cada conjunto se guarda como un array ordenado de enteros de 32 bits (4 bytes
+por id), se carga de la base la primera vez que se necesita y se mantiene al
+día en los endpoints de like/dislike. Se guardan los conjuntos de los
+MAX_USERS usuarios usados más recientemente.
+"""
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+MAX_USERS = 10000
+
+
+class SeenSet:
+    __slots__ = ("ids",)
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self.ids = array("i", sorted(set(ids)))
+
+    def __contains__(self, user_id: int) -> bool:
+        i = bisect.bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, user_id: int) -> None:
+        i = bisect.bisect_left(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            self.ids.insert(i, user_id)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.itemsize * len(self.ids)
+
+
+class SeenStore:
+    def __init__(self, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._sets: "OrderedDict[int, SeenSet]" = OrderedDict()
+
+    def get(self, db: Session, user_id: int) -> SeenSet:
+        with self._lock:
+            seen = self._sets.get(user_id)
+            if seen is not None:
+                self._sets.move_to_end(user_id)
+                return seen
+
+        liked = db.query(models.Like.liked_user_id).filter(models.Like.user_id == user_id)
+        disliked = db.query(models.Dislike.disliked_user_id).filter(models.Dislike.user_id == user_id)
+        seen = SeenSet(row[0] for row in liked.union(disliked))
+
+        with self._lock:
+            self._sets[user_id] = seen
+            while len(self._sets) > self.max_users:
+                self._sets.popitem(last=False)
+        return seen
+
+    def add(self, user_id: int, seen_user_id: int) -> None:
+        """Registrar un swipe; si el conjunto no está cargado se leerá de la base"""
+        with self._lock:
+            seen = self._sets.get(user_id)
+            if seen is not None:
+                seen.add(seen_user_id)
+
+
+seen_store = SeenStore()
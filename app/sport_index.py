@@ -0,0 +1,172 @@
+"""
+Índice invertido en memoria para la búsqueda de usuarios compatibles.
+
+Mantiene, por proceso, las posting lists (listas ordenadas de ids) por deporte
+normalizado y por ubicación, más un índice lateral ordenado por edad. Así los
+filtros de /users/compatible se resuelven intersectando listas de ids en lugar
+de recorrer toda la tabla de usuarios.
+
+El índice se construye al iniciar la aplicación y se actualiza en los endpoints
+que escriben el perfil. Cada worker tiene su propia copia.
+"""
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Edad que asume /users/compatible cuando el usuario no la cargó
+DEFAULT_AGE = 25
+
+
+def _insert(postings: List[int], user_id: int) -> None:
+    i = bisect.bisect_left(postings, user_id)
+    if i == len(postings) or postings[i] != user_id:
+        postings.insert(i, user_id)
+
+
+def _discard(postings: List[int], user_id: int) -> None:
+    i = bisect.bisect_left(postings, user_id)
+    if i < len(postings) and postings[i] == user_id:
+        del postings[i]
+
+
+class ProfileIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sports: Dict[str, List[int]] = {}
+        self._locations: Dict[str, List[int]] = {}
+        self._ages: List[Tuple[int, int]] = []
+        # user_id -> (deportes, edad, ubicación) tal como se indexaron
+        self._docs: Dict[int, Tuple[Tuple[str, ...], int, str]] = {}
+        self.ready = False
+
+    def build(self, users: Iterable) -> None:
+        """Reconstruye el índice completo a partir de un iterable de usuarios"""
+        docs = {user.id: self._document(user) for user in users}
+        sports: Dict[str, List[int]] = {}
+        locations: Dict[str, List[int]] = {}
+        ages = []
+        for user_id in sorted(docs):
+            user_sports, age, location = docs[user_id]
+            for sport in user_sports:
+                sports.setdefault(sport, []).append(user_id)
+            locations.setdefault(location, []).append(user_id)
+            ages.append((age, user_id))
+        ages.sort()
+
+        with self._lock:
+            self._sports = sports
+            self._locations = locations
+            self._ages = ages
+            self._docs = docs
+            self.ready = True
+
+    def upsert(self, user) -> None:
+        """Indexa (o reindexa) un usuario después de crearlo o editar su perfil"""
+        if not self.ready:
+            return
+        doc = self._document(user)
+        with self._lock:
+            if self._docs.get(user.id) == doc:
+                return
+            self._remove_locked(user.id)
+            user_sports, age, location = doc
+            for sport in user_sports:
+                _insert(self._sports.setdefault(sport, []), user.id)
+            _insert(self._locations.setdefault(location, []), user.id)
+            bisect.insort(self._ages, (age, user.id))
+            self._docs[user.id] = doc
+
+    def remove(self, user_id: int) -> None:
+        if not self.ready:
+            return
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def search(
+        self,
+        min_age: int,
+        max_age: int,
+        location: Optional[str] = None,
+        sports: Optional[List[str]] = None,
+        exclude: Optional[int] = None,
+    ) -> Dict[int, int]:
+        """
+        Devuelve {user_id: cantidad de deportes filtrados que practica} para los
+        usuarios que pasan los filtros, con la misma semántica que el filtrado
+        original de /users/compatible:
+        - edad (o DEFAULT_AGE si no tiene) dentro del rango
+        - misma ubicación (sin distinguir mayúsculas) o ubicación vacía
+        - al menos uno de los deportes filtrados
+        """
+        with self._lock:
+            candidates: Optional[Dict[int, int]] = None
+
+            if sports:
+                candidates = {}
+                for sport in set(sports):
+                    for user_id in self._sports.get(sport, ()):
+                        candidates[user_id] = candidates.get(user_id, 0) + 1
+
+            if location:
+                # Los usuarios sin ubicación cargada no se descartan
+                location_ids = self._locations.get(location.lower(), []) + self._locations.get("", [])
+                if candidates is None:
+                    candidates = dict.fromkeys(location_ids, 0)
+                elif len(location_ids) < len(candidates):
+                    candidates = {
+                        user_id: candidates[user_id]
+                        for user_id in location_ids if user_id in candidates
+                    }
+                else:
+                    location_set = set(location_ids)
+                    candidates = {
+                        user_id: count
+                        for user_id, count in candidates.items() if user_id in location_set
+                    }
+
+            if candidates is None:
+                # Sin filtros de deporte ni ubicación: la edad es el único filtro
+                lo = bisect.bisect_left(self._ages, (min_age, float("-inf")))
+                hi = bisect.bisect_right(self._ages, (max_age, float("inf")))
+                candidates = {user_id: 0 for _, user_id in self._ages[lo:hi]}
+            else:
+                candidates = {
+                    user_id: count
+                    for user_id, count in candidates.items()
+                    if min_age <= self._docs[user_id][1] <= max_age
+                }
+
+        candidates.pop(exclude, None)
+        return candidates
+
+    def _remove_locked(self, user_id: int) -> None:
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return
+        user_sports, age, location = doc
+        for sport in user_sports:
+            postings = self._sports.get(sport)
+            if postings is not None:
+                _discard(postings, user_id)
+                if not postings:
+                    del self._sports[sport]
+        postings = self._locations.get(location)
+        if postings is not None:
+            _discard(postings, user_id)
+            if not postings:
+                del self._locations[location]
+        i = bisect.bisect_left(self._ages, (age, user_id))
+        if i < len(self._ages) and self._ages[i] == (age, user_id):
+            del self._ages[i]
+
+    @staticmethod
+    def _document(user) -> Tuple[Tuple[str, ...], int, str]:
+        return (
+            tuple(sorted({sport.name.lower() for sport in user.sport_levels})),
+            user.age or DEFAULT_AGE,
+            (user.location or "").lower(),
+        )
+
+
+# Instancia compartida por los endpoints
+profile_index = ProfileIndex()
@@ -0,0 +1,125 @@
+"""
+Deportes normalizados de los usuarios.
+
+deportes_preferidos se sigue guardando tal como lo manda el frontend
+("Fútbol (Avanzado), Tenis (Intermedio)"), pero al escribir el perfil se
+parsea una sola vez a las tablas sports (vocabulario) y user_sports
+(user_id, sport_id, nivel). Los endpoints de lectura y el módulo de matching
+usan esos datos ya parseados.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from . import models
+
+DEFAULT_LEVEL = "Principiante"
+
+
+def parse_sport_levels(sports_str: Optional[str]) -> List[models.SportLevel]:
+    """
+    "Fútbol (Avanzado), Tenis" -> [SportLevel("Fútbol", "Avanzado"), SportLevel("Tenis", None)]
+    """
+    levels = []
+    seen = set()
+    for item in (sports_str or "").split(","):
+        item = item.strip()
+        level = None
+        if "(" in item and ")" in item:
+            # Formato: "Fútbol (Avanzado)"
+            item, level = item.rsplit("(", 1)
+            item = item.strip()
+            level = level.replace(")", "").strip() or None
+        # Mismos largos que las columnas sports.name y user_sports.level
+        item, level = item[:50], level[:30] if level else None
+        if item and item.lower() not in seen:
+            seen.add(item.lower())
+            levels.append(models.SportLevel(item, level))
+    return levels
+
+
+def parse_sport_names(sports_str: Optional[str]) -> List[str]:
+    """Nombres normalizados: "Fútbol (Avanzado), Tenis" -> ["fútbol", "tenis"]"""
+    return [sport.name.lower() for sport in parse_sport_levels(sports_str)]
+
+
+def sports_payload(user) -> List[Dict[str, str]]:
+    """Deportes en el formato array que usa el frontend"""
+    return [
+        {"sport": sport.name, "level": sport.level or DEFAULT_LEVEL}
+        for sport in user.sport_levels
+    ]
+
+
+def with_sports(query):
+    """Carga los deportes de los usuarios de `query` sin una consulta por usuario"""
+    return query.options(
+        selectinload(models.User.user_sports).joinedload(models.UserSport.sport)
+    )
+
+
+def sync_user_sports(db: Session, user: models.User) -> None:
+    """
+    Reemplaza las filas de user_sports del usuario según deportes_preferidos.
+    No hace commit: se guarda junto con el resto del perfil.
+    """
+    levels = parse_sport_levels(user.deportes_preferidos)
+    sports = _get_or_create_sports(db, levels)
+    user.user_sports = [
+        models.UserSport(sport=sports[sport.name.lower()], level=sport.level, position=position)
+        for position, sport in enumerate(levels)
+    ]
+
+
+def backfill_user_sports(db: Session, batch_size: int = 500) -> int:
+    """
+    Migra deportes_preferidos a user_sports para los usuarios que todavía no
+    tienen filas. Se puede correr varias veces; devuelve cuántos migró.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        users = (
+            db.query(models.User)
+            .filter(
+                models.User.id > last_id,
+                models.User.deportes_preferidos.isnot(None),
+                models.User.deportes_preferidos != "",
+                ~exists().where(models.UserSport.user_id == models.User.id),
+            )
+            .order_by(models.User.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not users:
+            return total
+        for user in users:
+            sync_user_sports(db, user)
+            if user.user_sports:
+                total += 1
+        last_id = users[-1].id
+        db.commit()
+
+
+def _get_or_create_sports(db: Session, levels: List[models.SportLevel]) -> Dict[str, models.Sport]:
+    names = {sport.name.lower(): sport.name for sport in levels}
+    if not names:
+        return {}
+    sports = {
+        sport.normalized: sport
+        for sport in db.query(models.Sport).filter(models.Sport.normalized.in_(names))
+    }
+    for normalized, name in names.items():
+        if normalized in sports:
+            continue
+        try:
+            with db.begin_nested():
+                sport = models.Sport(name=name, normalized=normalized)
+                db.add(sport)
+        except IntegrityError:
+            # Otro request lo creó al mismo tiempo
+            sport = db.query(models.Sport).filter(models.Sport.normalized == normalized).one()
+        sports[normalized] = sport
+    return sports
@@ -0,0 +1,267 @@
+"""
+Likes y matches apoyados en los índices únicos de likes(user_id, liked_user_id)
+y matches(user1_id, user2_id).
+
+Los inserts ignoran los conflictos (ON CONFLICT DO NOTHING en Postgres y
+SQLite) en vez de consultar antes si la fila existe, y el match se crea en la
+misma transacción que el like. Un like nuevo cuesta dos sentencias (insert +
+like inverso) y tres si hay match, sin importar el tamaño de las tablas.
+
+Antes de consultar el like inverso se pregunta a edge_filter: si el filtro
+dice que no existe, el like cuesta una sola sentencia.
+
+apply_swipes aplica una lista de likes y dislikes (POST /users/swipes) con
+una cantidad fija de sentencias por lote en vez de una por acción.
+"""
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, delete, exists, insert, literal, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .edge_filter import edge_filter
+
+# Columnas de los índices únicos (ver models.Like y models.Match)
+LIKE_KEY = ["user_id", "liked_user_id"]
+DISLIKE_KEY = ["user_id", "disliked_user_id"]
+MATCH_KEY = ["user1_id", "user2_id"]
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class LikeResult(NamedTuple):
+    created: bool
+    is_match: bool
+    match_id: Optional[int] = None
+
+
+class SwipeResult(NamedTuple):
+    user_id: int
+    action: str
+    success: bool
+    message: str
+    is_match: bool = False
+    match_id: Optional[int] = None
+    new_match: bool = False
+
+
+class TargetNotFound(Exception):
+    pass
+
+
+def insert_ignore(db: Session, model, index_elements: List[str], values=None, select_from=None, columns=None) -> int:
+    """
+    INSERT que ignora filas que violan el índice único `index_elements`.
+    Acepta `values` (dict o lista de dicts) o un SELECT con `columns`.
+    Devuelve cuántas filas se insertaron.
+    """
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    stmt = (dialect_insert or insert)(model)
+    stmt = stmt.from_select(columns, select_from) if select_from is not None else stmt.values(values)
+    if dialect_insert is not None:
+        return db.execute(stmt.on_conflict_do_nothing(index_elements=index_elements)).rowcount
+
+    # Otros motores: el conflicto se descarta con un savepoint
+    try:
+        with db.begin_nested():
+            return db.execute(stmt).rowcount
+    except IntegrityError:
+        return 0
+
+
+def match_pair(user_a: int, user_b: int):
+    """Los matches se guardan con user1_id < user2_id"""
+    return min(user_a, user_b), max(user_a, user_b)
+
+
+def lock_pair(db: Session, user_a: int, user_b: int) -> None:
+    """
+    En Postgres serializa los likes cruzados entre dos usuarios: sin esto dos
+    likes mutuos simultáneos no ven el like del otro y ninguno crea el match.
+    SQLite ya serializa las escrituras.
+    """
+    lock_pairs(db, user_a, [user_b])
+
+
+def lock_pairs(db: Session, user_id: int, others: Sequence[int]) -> None:
+    """lock_pair para varios pares en una sentencia, en orden para no trabarse"""
+    if db.get_bind().dialect.name != "postgresql" or not others:
+        return
+    keys = sorted({(pair[0] << 32) | pair[1] for pair in (match_pair(user_id, other) for other in others)})
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(key) FROM (SELECT unnest(CAST(:keys AS bigint[])) AS key ORDER BY key) AS pairs"),
+        {"keys": keys},
+    )
+
+
+def create_match(db: Session, user_a: int, user_b: int) -> Optional[int]:
+    """Crea el match si no existe; devuelve su id si lo creó"""
+    user1_id, user2_id = match_pair(user_a, user_b)
+    now = datetime.utcnow()
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = (
+            dialect_insert(models.Match)
+            .values(user1_id=user1_id, user2_id=user2_id, created_at=now, last_activity_at=now)
+            .on_conflict_do_nothing(index_elements=MATCH_KEY)
+            .returning(models.Match.id)
+        )
+        return db.execute(stmt).scalar()
+    values = {"user1_id": user1_id, "user2_id": user2_id, "created_at": now, "last_activity_at": now}
+    if insert_ignore(db, models.Match, MATCH_KEY, values=values):
+        return find_match_id(db, user_a, user_b)
+    return None
+
+
+def find_match_id(db: Session, user_a: int, user_b: int) -> Optional[int]:
+    user1_id, user2_id = match_pair(user_a, user_b)
+    return db.query(models.Match.id).filter(
+        models.Match.user1_id == user1_id, models.Match.user2_id == user2_id
+    ).scalar()
+
+
+def has_liked(db: Session, user_id: int, liked_user_id: int) -> bool:
+    return db.query(exists().where(
+        models.Like.user_id == user_id, models.Like.liked_user_id == liked_user_id
+    )).scalar()
+
+
+def record_like(db: Session, user_id: int, liked_user_id: int) -> LikeResult:
+    """
+    Registra el like y, si es mutuo, el match. No hace commit: el like y el
+    match se confirman juntos. Lanza TargetNotFound si el usuario no existe.
+    """
+    lock_pair(db, user_id, liked_user_id)
+    # Antes del insert: un like mutuo concurrente tiene que encontrarlo en el filtro
+    edge_filter.add(user_id, liked_user_id)
+
+    # El SELECT sobre users reemplaza la consulta previa de existencia
+    target = select(literal(user_id), models.User.id).where(models.User.id == liked_user_id)
+    created = insert_ignore(db, models.Like, LIKE_KEY, select_from=target, columns=LIKE_KEY) > 0
+
+    if not created:
+        # Ya existía el like, o el usuario no existe
+        match_id = find_match_id(db, user_id, liked_user_id)
+        if match_id is None and not has_liked(db, user_id, liked_user_id):
+            raise TargetNotFound(liked_user_id)
+        return LikeResult(False, match_id is not None, match_id)
+
+    if not edge_filter.might_contain(liked_user_id, user_id):
+        return LikeResult(True, False)
+    if not has_liked(db, liked_user_id, user_id):
+        edge_filter.record_false_positive()
+        return LikeResult(True, False)
+    match_id = create_match(db, user_id, liked_user_id)
+    if match_id is None:
+        # El match ya existía (por ejemplo, un like que se deshizo y se volvió a dar)
+        match_id = find_match_id(db, user_id, liked_user_id)
+    return LikeResult(True, True, match_id)
+
+
+def apply_swipes(db: Session, user_id: int, actions: Sequence[Tuple[int, str]]) -> List[SwipeResult]:
+    """
+    Aplica en orden una lista de (user_id, "like" | "dislike") con el mismo
+    resultado que llamar uno por uno a los endpoints de like y dislike.
+
+    El estado inicial (likes, dislikes y matches con esos usuarios) se lee
+    con una consulta por tabla, las acciones se resuelven en memoria y las
+    diferencias se escriben con un insert o delete por tabla. No hace commit.
+    """
+    targets = {target for target, _ in actions if target != user_id}
+    liked_targets = [target for target, action in actions if action == "like" and target in targets]
+    lock_pairs(db, user_id, liked_targets)
+    for target in liked_targets:
+        edge_filter.add(user_id, target)
+    # Solo se consulta el like inverso de quienes el filtro no descarta
+    maybe_liked_back = [target for target in set(liked_targets) if edge_filter.might_contain(target, user_id)]
+
+    existing_users = _ids(db, select(models.User.id).where(models.User.id.in_(targets)))
+    liked = _ids(db, select(models.Like.liked_user_id).where(
+        models.Like.user_id == user_id, models.Like.liked_user_id.in_(targets)
+    ))
+    liked_back = _ids(db, select(models.Like.user_id).where(
+        models.Like.user_id.in_(maybe_liked_back), models.Like.liked_user_id == user_id
+    )) if maybe_liked_back else set()
+    for _ in range(len(set(maybe_liked_back) - liked_back)):
+        edge_filter.record_false_positive()
+    disliked = _ids(db, select(models.Dislike.disliked_user_id).where(
+        models.Dislike.user_id == user_id, models.Dislike.disliked_user_id.in_(targets)
+    ))
+    matches = _match_ids(db, user_id, targets)
+
+    initial_liked, initial_disliked = set(liked), set(disliked)
+    results: List[SwipeResult] = []
+    new_matches: Set[int] = set()
+    for target, action in actions:
+        if target == user_id:
+            message = "No puedes darte like a ti mismo" if action == "like" else "No puedes rechazarte a ti mismo"
+            results.append(SwipeResult(target, action, False, message))
+        elif target not in existing_users:
+            results.append(SwipeResult(target, action, False, "Usuario no encontrado"))
+        elif action == "dislike":
+            liked.discard(target)
+            disliked.add(target)
+            results.append(SwipeResult(target, action, True, "Dislike registrado"))
+        elif target in liked:
+            is_match = target in matches or target in new_matches
+            message = "Ya le diste like a este usuario" + (" y es un match!" if is_match else "")
+            results.append(SwipeResult(target, action, True, message, is_match))
+        else:
+            liked.add(target)
+            is_match = target in liked_back
+            new_match = is_match and target not in matches and target not in new_matches
+            if new_match:
+                new_matches.add(target)
+            results.append(SwipeResult(
+                target, action, True, "¡Es un match! 🎉" if is_match else "Like registrado", is_match,
+                new_match=new_match,
+            ))
+
+    # Diferencias contra el estado inicial
+    if liked - initial_liked:
+        insert_ignore(db, models.Like, LIKE_KEY, values=[
+            {"user_id": user_id, "liked_user_id": target, "created_at": datetime.utcnow()}
+            for target in sorted(liked - initial_liked)
+        ])
+    if initial_liked - liked:
+        db.execute(delete(models.Like).where(
+            models.Like.user_id == user_id, models.Like.liked_user_id.in_(initial_liked - liked)
+        ))
+        for target in initial_liked - liked:
+            edge_filter.discard(user_id, target)
+    if disliked - initial_disliked:
+        insert_ignore(db, models.Dislike, DISLIKE_KEY, values=[
+            {"user_id": user_id, "disliked_user_id": target, "created_at": datetime.utcnow()}
+            for target in sorted(disliked - initial_disliked)
+        ])
+    if new_matches:
+        now = datetime.utcnow()
+        insert_ignore(db, models.Match, MATCH_KEY, values=[
+            dict(zip(MATCH_KEY, match_pair(user_id, target)), created_at=now, last_activity_at=now)
+            for target in sorted(new_matches)
+        ])
+        matches.update(_match_ids(db, user_id, new_matches))
+
+    return [
+        result._replace(match_id=matches.get(result.user_id)) if result.is_match else result
+        for result in results
+    ]
+
+
+def _ids(db: Session, stmt) -> Set[int]:
+    return set(db.execute(stmt).scalars())
+
+
+def _match_ids(db: Session, user_id: int, others) -> Dict[int, int]:
+    """{otro usuario: match_id} de los matches de `user_id` con `others`"""
+    others = list(others)
+    if not others:
+        return {}
+    rows = db.execute(select(models.Match.id, models.Match.user1_id, models.Match.user2_id).where(or_(
+        and_(models.Match.user1_id == user_id, models.Match.user2_id.in_(others)),
+        and_(models.Match.user2_id == user_id, models.Match.user1_id.in_(others)),
+    )))
+    return {user2 if user1 == user_id else user1: match_id for match_id, user1, user2 in rows}
@@ -0,0 +1,52 @@
+"""
+Falsos positivos y memoria del filtro de likes (app/edge_filter.py).
+
+Carga `--edges` likes sintéticos, mide la tasa real de falsos positivos con
+likes que no existen y la compara con la teórica.
+
+    python -m benchmarks.edge_filter --edges 10000000
+"""
+import argparse
+import random
+import time
+
+from app.edge_filter import CAPACITY, EdgeFilter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, default=CAPACITY)
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--probes", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    edges = set()
+    while len(edges) < args.edges:
+        edges.add((rng.randrange(1, args.users), rng.randrange(1, args.users)))
+
+    edge_filter = EdgeFilter(capacity=args.edges)
+    start = time.perf_counter()
+    edge_filter.build(edges)
+    build_s = time.perf_counter() - start
+
+    false_positives = probes = 0
+    start = time.perf_counter()
+    while probes < args.probes:
+        edge = (rng.randrange(1, args.users), rng.randrange(1, args.users))
+        if edge in edges:
+            continue
+        probes += 1
+        false_positives += edge_filter.might_contain(*edge)
+    check_us = (time.perf_counter() - start) * 1e6 / probes
+
+    stats = edge_filter.stats()
+    print(f"🔗 {args.edges} likes, construido en {build_s:.1f} s")
+    print(f"💾 Memoria: {stats['memory_bytes'] / 2**20:.1f} MiB ({stats['bits']} bits, {stats['hashes']} hashes)")
+    print(f"🎯 Falsos positivos: {false_positives / probes:.4%} medidos, {stats['expected_fp_rate']:.4%} teóricos")
+    print(f"⏱️ {check_us:.1f} µs por consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Likes por segundo: camino actual (insert + commit por like) contra el modo
+write-behind de app/like_queue.py (journal + inserts de varias filas).
+
+Usa una base SQLite temporal salvo que se pase --database-url (cuidado: crea
+usuarios y likes en esa base).
+
+    python -m benchmarks.like_throughput --likes 5000 --threads 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--likes", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--no-fsync", action="store_true")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="like_bench_")
+    # Antes de importar app: database.py se conecta al importarse
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir}/bench.db"
+    from app import database, models, swipes
+    from app.edge_filter import edge_filter
+    from app.like_queue import like_queue
+
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    first_id = (db.query(models.User.id).order_by(models.User.id.desc()).limit(1).scalar() or 0) + 1
+    db.bulk_insert_mappings(models.User, [
+        {"username": f"bench_{first_id + i}", "email": f"bench_{first_id + i}@bench.local", "password": "x"}
+        for i in range(args.users)
+    ])
+    db.commit()
+    db.close()
+    user_ids = list(range(first_id, first_id + args.users))
+    edge_filter.build([])
+
+    rng = random.Random(5)
+    pairs = set()
+    while len(pairs) < 2 * args.likes:
+        a, b = rng.sample(user_ids, 2)
+        pairs.add((a, b))
+    pairs = list(pairs)
+    direct_pairs, queued_pairs = pairs[:args.likes], pairs[args.likes:]
+
+    def like_direct(pair):
+        session = database.SessionLocal()
+        try:
+            result = swipes.record_like(session, *pair)
+            session.commit()
+            return result.is_match
+        finally:
+            session.close()
+
+    def like_queued(pair):
+        session = database.SessionLocal()
+        try:
+            return like_queue.record_like(session, *pair).is_match
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        start = time.perf_counter()
+        direct_matches = sum(pool.map(like_direct, direct_pairs))
+        direct_s = time.perf_counter() - start
+
+    like_queue.start(os.path.join(workdir, "likes.journal"), fsync=not args.no_fsync)
+    with ThreadPoolExecutor(args.threads) as pool:
+        start = time.perf_counter()
+        queued_matches = sum(pool.map(like_queued, queued_pairs))
+        ack_s = time.perf_counter() - start
+    like_queue.drain()
+    durable_s = time.perf_counter() - start
+
+    db = database.SessionLocal()
+    stored = db.query(models.Like).filter(models.Like.user_id >= first_id).count()
+    db.close()
+
+    print(f"🗄️ {os.environ['DATABASE_URL'].split('://')[0]}, {args.likes} likes por modo, {args.threads} threads")
+    print(f"❤️ Directo:       {args.likes / direct_s:8.0f} likes/s ({direct_matches} matches)")
+    print(f"📝 Write-behind:  {args.likes / ack_s:8.0f} likes/s confirmados, "
+          f"{args.likes / durable_s:8.0f} likes/s hasta estar en la base ({queued_matches} matches)")
+    print(f"✅ Likes en la base: {stored} de {2 * args.likes}")
+    return 0 if stored == 2 * args.likes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
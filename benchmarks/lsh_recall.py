@@ -0,0 +1,121 @@
+"""
+Recall del modo aproximado (app/lsh.py) contra el scorer exacto.
+
+Genera una población sintética, arma el top-k exacto con ProfileMatrix y el
+aproximado con SportLSH + calculate_compatibility_score sobre los candidatos
+(lo mismo que hace get_compatible_users con LSH_ENABLED=1), para varias
+combinaciones de bandas y filas.
+
+    python -m benchmarks.lsh_recall --users 50000 --queries 200 --k 20
+
+El recall cuenta empates: un resultado aproximado es correcto si su score es
+al menos el k-ésimo score exacto. Se mide contra el ranking de solo deportes
+(lo que aproxima LSH) y contra el score completo, que además suma ubicación,
+edad y cercanía, variando cuántos candidatos se rankean.
+"""
+import argparse
+import heapq
+import random
+import time
+from typing import NamedTuple, Optional
+
+from app.lsh import SportLSH
+from app.matching import LSH_CANDIDATES_FACTOR, calculate_compatibility_score
+from app.models import SportLevel
+from app.scoring import ProfileMatrix
+
+SPORTS = [
+    "Fútbol", "Tenis", "Pádel", "Running", "Natación", "Yoga", "Ciclismo", "Básquet",
+    "Vóley", "Boxeo", "Escalada", "Crossfit", "Hockey", "Rugby", "Golf", "Remo",
+    "Surf", "Skate", "Trekking", "Handball", "Squash", "Karate", "Judo", "Pilates",
+]
+LEVELS = ["Principiante", "Intermedio", "Avanzado", None]
+LOCATIONS = ["Palermo", "Belgrano", "Caballito", "Recoleta", "Núñez", None]
+
+
+class Profile(NamedTuple):
+    id: int
+    sport_levels: tuple
+    age: Optional[int]
+    location: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+def make_profile(rng: random.Random, user_id: int) -> Profile:
+    # Deportes con distribución sesgada: los primeros son los más populares
+    count = rng.choice([1, 1, 2, 2, 3, 4])
+    names = set()
+    while len(names) < count:
+        names.add(SPORTS[min(int(rng.expovariate(0.15)), len(SPORTS) - 1)])
+    sports = tuple(SportLevel(name, rng.choice(LEVELS)) for name in sorted(names))
+    coords = (-34.6 + rng.uniform(-0.3, 0.3), -58.4 + rng.uniform(-0.3, 0.3)) if rng.random() < 0.7 else (None, None)
+    return Profile(user_id, sports, rng.choice([None, *range(18, 60)]), rng.choice(LOCATIONS), *coords)
+
+
+def recall(approx, exact_scores) -> int:
+    """Aciertos de `approx` contando empates con el k-ésimo score exacto"""
+    if not exact_scores:
+        return 0
+    threshold = exact_scores[-1]
+    return sum(1 for score in approx if score >= threshold - 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    profiles = [make_profile(rng, i) for i in range(1, args.users + 1)]
+    by_id = {profile.id: profile for profile in profiles}
+    queries = rng.sample(profiles, args.queries)
+
+    # Score completo y solo deportes (sin edad, ubicación ni coordenadas)
+    matrix = ProfileMatrix()
+    matrix.build(profiles)
+    sports_only = ProfileMatrix()
+    sports_only.build(p._replace(age=None, location=None, latitude=None, longitude=None) for p in profiles)
+    start = time.perf_counter()
+    exact = {query.id: matrix.top(query, args.k)[1].tolist() for query in queries}
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    exact_sports = {query.id: sports_only.top(query, args.k)[1].tolist() for query in queries}
+    print(f"👥 {args.users} usuarios, {args.queries} consultas, k={args.k}")
+    print(f"🎯 Exacto (ProfileMatrix): {exact_ms:.2f} ms/consulta")
+    print("recall deportes = contra el ranking exacto de solo deportes (lo que aproxima LSH)")
+    print("recall score = contra el score completo (lo que devuelve get_compatible_users)")
+
+    for include_level in (True, False):
+        for bands, rows in ((8, 1), (16, 2), (16, 3), (32, 4)):
+            lsh = SportLSH(bands=bands, rows=rows, include_level=include_level)
+            lsh.build(profiles)
+            for factor in sorted({5, LSH_CANDIDATES_FACTOR, 100}):
+                sport_hits = score_hits = total = candidates_seen = 0
+                start = time.perf_counter()
+                for query in queries:
+                    candidates = lsh.candidates(query, args.k * factor)
+                    candidates_seen += len(candidates)
+                    scored = (
+                        (calculate_compatibility_score(query, by_id[user_id]), user_id)
+                        for user_id, _ in candidates
+                    )
+                    approx = heapq.nsmallest(args.k, scored, key=lambda item: (-item[0], item[1]))
+                    score_hits += recall([score for score, _ in approx], exact[query.id])
+                    sport_hits += recall([40 * similarity for _, similarity in candidates[:args.k]], exact_sports[query.id])
+                    total += len(exact[query.id])
+                elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+                print(
+                    f"{'nivel' if include_level else 'nombre'} bands={bands:2d} rows={rows} "
+                    f"candidatos=k*{factor:<3d}: "
+                    f"recall deportes={sport_hits / total:.3f} "
+                    f"recall score={score_hits / total:.3f} "
+                    f"candidatos={candidates_seen / len(queries):.0f} "
+                    f"{elapsed_ms:.2f} ms/consulta"
+                )
+
+
+if __name__ == "__main__":
+    main()
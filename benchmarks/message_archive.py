@@ -0,0 +1,137 @@
+"""
+Historial con y sin archivo de mensajes viejos (app/archive.py).
+
+Llena una base SQLite temporal con --messages mensajes repartidos en
+--matches chats a lo largo de dos años, mide la página más nueva del
+historial (el camino caliente), archiva lo que tenga más de
+--older-than-days días y vuelve a medir. También mide una página profunda
+que tiene que leer del archivo.
+
+    python -m benchmarks.message_archive --messages 2000000 --matches 20000
+
+Con --messages 50000000 reproduce el caso de 50M (tarda y ocupa varios GB).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+INSERT_BATCH = 100000
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--matches", type=int, default=20000)
+    parser.add_argument("--older-than-days", type=int, default=90)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="archive_bench_")
+    path = os.path.join(workdir, "bench.db")
+    # Antes de importar app: database.py se conecta al importarse
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import archive, chat, database, models
+
+    models.Base.metadata.create_all(bind=database.engine)
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    start = now - timedelta(days=730)
+    step = (now - start) / args.messages
+
+    raw = database.engine.raw_connection()
+    cursor = raw.cursor()
+    cursor.executemany(
+        "INSERT INTO users (id, username, email, password) VALUES (?, ?, ?, 'x')",
+        [(i, f"bench_{i}", f"bench_{i}@bench.local") for i in range(1, 2 * args.matches + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO matches (id, user1_id, user2_id, created_at) VALUES (?, ?, ?, ?)",
+        [(m, 2 * m - 1, 2 * m, str(start)) for m in range(1, args.matches + 1)],
+    )
+    began = time.perf_counter()
+    for first in range(1, args.messages + 1, INSERT_BATCH):
+        rows = []
+        for message_id in range(first, min(first + INSERT_BATCH, args.messages + 1)):
+            match_id = rng.randint(1, args.matches)
+            rows.append((
+                message_id, match_id, 2 * match_id - rng.randint(0, 1),
+                f"mensaje {message_id} " + "x" * rng.randint(10, 80), str(start + step * message_id),
+            ))
+        cursor.executemany(
+            "INSERT INTO messages (id, match_id, sender_id, content, created_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        raw.commit()
+    # Todos leídos salvo los últimos mensajes de uno de cada diez chats
+    cursor.execute(
+        "UPDATE matches SET last_message_id = (SELECT max(id) FROM messages WHERE match_id = matches.id)"
+    )
+    cursor.execute(
+        "UPDATE matches SET user1_last_read_id = coalesce(last_message_id, 0),"
+        " user2_last_read_id = coalesce(last_message_id, 0) - (id % 10 = 0) * 20"
+    )
+    raw.commit()
+    print(f"🗄️ {args.messages} mensajes en {args.matches} chats cargados en {time.perf_counter() - began:.0f}s")
+
+    def newest_page_latency(match_ids):
+        session = database.SessionLocal()
+        samples = []
+        try:
+            for match_id in match_ids:
+                match = session.get(models.Match, match_id)
+                t = time.perf_counter()
+                chat.history_page(session, match_id, archived_through=match.archived_through_id)
+                samples.append((time.perf_counter() - t) * 1000)
+        finally:
+            session.close()
+        return samples
+
+    def db_size():
+        cursor.execute("VACUUM")
+        return os.path.getsize(path) / 2 ** 20
+
+    sample = [rng.randint(1, args.matches) for _ in range(args.requests)]
+    hot_before = newest_page_latency(sample)
+    size_before = db_size()
+
+    session = database.SessionLocal()
+    began = time.perf_counter()
+    archived = archive.archive_old_messages(session, args.older_than_days)
+    archive_s = time.perf_counter() - began
+    hot_rows = session.query(models.Message).count()
+    chunks = session.query(models.MessageArchive).count()
+    session.close()
+
+    hot_after = newest_page_latency(sample)
+    size_after = db_size()
+
+    # Página profunda: los mensajes anteriores a los 100 primeros del chat, ya en el archivo
+    session = database.SessionLocal()
+    deep = []
+    for match_id in sample[:200]:
+        match = session.get(models.Match, match_id)
+        t = time.perf_counter()
+        chat.history_page(session, match_id, before_id=match.archived_through_id // 2 or 1,
+                          archived_through=match.archived_through_id)
+        deep.append((time.perf_counter() - t) * 1000)
+    session.close()
+    raw.close()
+
+    print(f"📦 Archivados {archived} mensajes en {chunks} bloques ({archive_s:.0f}s); quedan {hot_rows} en messages")
+    print(f"💾 Base: {size_before:.0f} MB antes, {size_after:.0f} MB después")
+    print(f"⚡ Página más nueva antes:  p50 {percentile(hot_before, 0.5):.3f} ms, p99 {percentile(hot_before, 0.99):.3f} ms")
+    print(f"⚡ Página más nueva después: p50 {percentile(hot_after, 0.5):.3f} ms, p99 {percentile(hot_after, 0.99):.3f} ms")
+    print(f"🐢 Página desde el archivo: p50 {percentile(deep, 0.5):.3f} ms, p99 {percentile(deep, 0.99):.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())